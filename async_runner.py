@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import queue
+import threading
+
+__version__ = "1.0.0"
+
+
+class AsyncRunner:
+    """Owns an asyncio event loop running in a background thread.
+
+    Coroutines are submitted from any thread and come back as
+    concurrent.futures.Future objects, so network I/O never runs on the
+    thread that submitted it.
+    """
+
+    def __init__(self, name='asyncio-loop'):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self, cleanup=None, timeout=5):
+        """Cancel pending tasks, then await the optional cleanup coroutine function and stop the loop thread."""
+        if not self.loop.is_running():
+            return
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if cleanup is not None:
+                await cleanup()
+
+        try:
+            self.submit(shutdown()).result(timeout)
+        except Exception as e:
+            logging.warning(f"Arrêt incomplet de la boucle asyncio: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+
+class TkDispatcher:
+    """Runs callbacks on the Tk thread.
+
+    Worker threads post callbacks to a queue that the Tk thread drains with
+    after(), since Tk widgets must only be touched from the thread running
+    mainloop().
+    """
+
+    def __init__(self, root, interval=50):
+        self.root = root
+        self.interval = interval
+        self.callbacks = queue.Queue()
+        self.root.after(self.interval, self._poll)
+
+    def post(self, callback, *args):
+        self.callbacks.put((callback, args))
+
+    def _poll(self):
+        try:
+            while True:
+                callback, args = self.callbacks.get_nowait()
+                try:
+                    callback(*args)
+                except Exception as e:
+                    logging.error(f"Erreur dans un rappel de l'interface: {e}")
+        except queue.Empty:
+            pass
+        self.root.after(self.interval, self._poll)
+
+
+class TkAsyncBridge:
+    """Runs coroutines on an AsyncRunner and reports results, errors and progress on the Tk thread."""
+
+    def __init__(self, root, runner=None):
+        self.runner = runner or AsyncRunner()
+        self.dispatcher = TkDispatcher(root)
+
+    def run(self, coro_factory, on_done=None, on_error=None, on_progress=None):
+        """Start coro_factory(progress) on the loop thread and return its future (call .cancel() to abort).
+
+        progress(value) may be called from the coroutine; on_progress receives
+        each value on the Tk thread.
+        """
+        def progress(value):
+            if on_progress is not None:
+                self.dispatcher.post(on_progress, value)
+
+        future = self.runner.submit(coro_factory(progress))
+
+        def done(future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                if on_error is not None:
+                    self.dispatcher.post(on_error, error)
+                else:
+                    logging.error(f"Erreur dans une tâche en arrière-plan: {error}")
+            elif on_done is not None:
+                self.dispatcher.post(on_done, future.result())
+
+        future.add_done_callback(done)
+        return future
+
+    def stop(self, cleanup=None):
+        self.runner.stop(cleanup)
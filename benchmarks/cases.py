@@ -0,0 +1,216 @@
+"""Benchmark cases. Each runs in its own process and returns {metric: (value, unit, better)}."""
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks import generators
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCALES = {
+    'small': {'epg_channels': 500, 'epg_programmes': 50_000, 'm3u_entries': 50_000, 'vod_titles': 20_000,
+              'vod_queries': 300, 'subscriptions': 200, 'hosts': 5},
+    'full': {'epg_channels': 5000, 'epg_programmes': 1_000_000, 'm3u_entries': 500_000, 'vod_titles': 200_000,
+             'vod_queries': 1000, 'subscriptions': 2000, 'hosts': 20},
+}
+
+LOWER, HIGHER = 'lower', 'higher'
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def _cached(workdir, name, generate):
+    """Generate an input file once per parameter set and reuse it across runs."""
+    path = os.path.join(workdir, name)
+    if not os.path.exists(path):
+        generate(path + '.partial')
+        os.replace(path + '.partial', path)
+    return path
+
+
+def _guide_path(workdir, params):
+    name = f"guide-{params['epg_channels']}-{params['epg_programmes']}.xml.gz"
+    return _cached(workdir, name, lambda path: generators.write_xmltv(path, params['epg_channels'], params['epg_programmes']))
+
+
+def epg_parse(workdir, params):
+    """epg.parse_guide_file: the in-memory parse used by EpgManager.refresh_all workers."""
+    from epg import parse_guide_file
+    path = _guide_path(workdir, params)
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    guide = parse_guide_file(path)
+    elapsed = time.perf_counter() - started
+    count = sum(len(programmes) for programmes in guide.values())
+    return {
+        'seconds': (elapsed, 's', LOWER),
+        'programmes_per_second': (count / elapsed, '1/s', HIGHER),
+        'peak_rss_mb': (peak_rss_mb(), 'MB', LOWER),
+        'rss_growth_mb': (peak_rss_mb() - rss_before if rss_before is not None else None, 'MB', LOWER),
+    }
+
+
+def epg_import(workdir, params):
+    """EpgManager.parse_epg_file: streaming parse straight into a fresh SQLite store."""
+    from epg import EpgManager
+    from epg_store import EpgStore
+    path = _guide_path(workdir, params)
+    db_path = os.path.join(workdir, f'epg-import-{os.getpid()}.db')
+    store = EpgStore(db_path)
+    try:
+        manager = EpgManager(store=store)
+        started = time.perf_counter()
+        count = manager.parse_epg_file(path)
+        elapsed = time.perf_counter() - started
+        started = time.perf_counter()
+        manager.parse_epg_file(path)  # unchanged guide: upserts find nothing to change
+        reimport = time.perf_counter() - started
+    finally:
+        store.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+    return {
+        'seconds': (elapsed, 's', LOWER),
+        'reimport_seconds': (reimport, 's', LOWER),
+        'programmes_per_second': (count / elapsed, '1/s', HIGHER),
+        'peak_rss_mb': (peak_rss_mb(), 'MB', LOWER),
+    }
+
+
+def vod_search(workdir, params):
+    """VodManager load time and search_vod latency percentiles."""
+    from vod import VodItem, VodManager
+    titles = generators.make_vod_titles(params['vod_titles'])
+    queries = generators.vod_queries(titles, params['vod_queries'])
+    manager = VodManager()
+    started = time.perf_counter()
+    manager.load_items(VodItem(item_id, title, None, None) for item_id, title in titles)
+    load = time.perf_counter() - started
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        # Default limit: only the 50 best titles are ranked and returned
+        manager.search_vod(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        'load_seconds': (load, 's', LOWER),
+        'search_p50_ms': (percentile(latencies, 0.5), 'ms', LOWER),
+        'search_p95_ms': (percentile(latencies, 0.95), 'ms', LOWER),
+        'search_p99_ms': (percentile(latencies, 0.99), 'ms', LOWER),
+        'search_max_ms': (max(latencies), 'ms', LOWER),
+        'peak_rss_mb': (peak_rss_mb(), 'MB', LOWER),
+    }
+
+
+def playlist_import(workdir, params):
+    """M3uParser on a large local playlist: first parse, then replay from its cache."""
+    from m3u_parser import M3uParser
+    path = _cached(workdir, f"playlist-{params['m3u_entries']}.m3u",
+                   lambda path: generators.write_m3u(path, params['m3u_entries']))
+    cache_dir = os.path.join(workdir, f'm3u-cache-{os.getpid()}')
+    try:
+        started = time.perf_counter()
+        count = sum(1 for _ in M3uParser(path, cache_dir=cache_dir))
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        sum(1 for _ in M3uParser(path, cache_dir=cache_dir))
+        cached = time.perf_counter() - started
+    finally:
+        for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else ():
+            os.remove(os.path.join(cache_dir, name))
+        if os.path.isdir(cache_dir):
+            os.rmdir(cache_dir)
+    return {
+        'cold_seconds': (cold, 's', LOWER),
+        'cached_seconds': (cached, 's', LOWER),
+        'entries_per_second': (count / cold, '1/s', HIGHER),
+        'peak_rss_mb': (peak_rss_mb(), 'MB', LOWER),
+    }
+
+
+def _serve_stub(ports, latency, error_rate, ready):
+    from benchmarks.stub_portal import StubPortal
+
+    async def serve():
+        portal = StubPortal(latency=latency, error_rate=error_rate, ports=ports)
+        ready.put(await portal.start())
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def health_check(workdir, params, latency=0.05, error_rate=0.05):
+    """SubscriptionManager.check_connectivity_async against the stub portal, served from another process."""
+    import multiprocessing
+    from health_check import CheckScheduler
+    from http_client import get_client
+    from subscription_store import SubscriptionStore
+    from subscriptions import SubscriptionManager
+
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    server = context.Process(target=_serve_stub, args=((0,) * params['hosts'], latency, error_rate, ready), daemon=True)
+    server.start()
+    db_path = os.path.join(workdir, f'subscriptions-{os.getpid()}.db')
+    store = None
+    try:
+        hosts = ready.get(timeout=30)
+        store = SubscriptionStore(db_path)
+        subscriptions = {}
+        for i in range(params['subscriptions']):
+            url = f"{hosts[i % len(hosts)]}/c/?sub={i}"
+            mac = f"00:1A:79:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}"
+            store.add(url, mac, 'MAC Portal')
+            subscriptions[url] = [{'mac': mac, 'active': True, 'type': 'MAC Portal'}]
+        store.flush()
+        # Short backoff so the run measures throughput rather than retry sleeps
+        manager = SubscriptionManager(scheduler=CheckScheduler(base_delay=0.05, max_delay=0.2), store=store)
+        manager.subscriptions = subscriptions
+
+        async def run():
+            started = time.perf_counter()
+            results = await manager.check_connectivity_async()
+            elapsed = time.perf_counter() - started
+            await get_client().close()
+            return results, elapsed
+
+        results, elapsed = asyncio.run(run())
+        latencies = [result.latency * 1000 for result in results if result.latency is not None]
+        return {
+            'seconds': (elapsed, 's', LOWER),
+            'checks_per_second': (len(results) / elapsed, '1/s', HIGHER),
+            'ok_ratio': (sum(result.ok for result in results) / len(results), '', HIGHER),
+            'latency_p95_ms': (percentile(latencies, 0.95) if latencies else None, 'ms', LOWER),
+        }
+    finally:
+        server.terminate()
+        server.join()
+        if store is not None:
+            store.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+CASES = {
+    'epg_parse': epg_parse,
+    'epg_import': epg_import,
+    'vod_search': vod_search,
+    'playlist_import': playlist_import,
+    'health_check': health_check,
+}
@@ -0,0 +1,90 @@
+"""Deterministic synthetic data: XMLTV guides, M3U playlists and VOD catalogs."""
+import gzip
+import random
+import time
+from xml.sax.saxutils import escape, quoteattr
+
+WORDS = (
+    'news sport cinema kids music docu meteo journal match live direct soir matin'
+    ' film serie magazine classique action comedie drame aventure histoire nature'
+    ' voyage cuisine auto moto foot rugby tennis basket formule jeux quiz talk'
+).split()
+
+
+def _title(rng, words=(2, 5)):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(*words))).title()
+
+
+def write_xmltv(path, channels=5000, programmes=1_000_000, seed=1, start=None):
+    """Write an XMLTV guide (gzipped when path ends in .gz) spread evenly over channels.
+
+    Programmes are 30 to 90 minutes long and start one day before start
+    (default: now), so they fall inside the store's retention window.
+    """
+    rng = random.Random(seed)
+    start = int(start or time.time()) // 60 * 60 - 86400
+    per_channel = max(1, programmes // channels)
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="checkerip-bench">\n')
+        for channel in range(channels):
+            f.write(f'<channel id="ch{channel}.bench"><display-name>{escape(_title(rng))} {channel}</display-name></channel>\n')
+        for channel in range(channels):
+            at = start
+            for _ in range(per_channel):
+                stop = at + rng.choice((30, 45, 60, 90)) * 60
+                f.write(
+                    f'<programme start="{time.strftime("%Y%m%d%H%M%S", time.gmtime(at))} +0000" '
+                    f'stop="{time.strftime("%Y%m%d%H%M%S", time.gmtime(stop))} +0000" channel="ch{channel}.bench">'
+                    f'<title>{escape(_title(rng))}</title><desc>{escape(_title(rng, (8, 20)))}</desc></programme>\n'
+                )
+                at = stop
+        f.write('</tv>\n')
+    return per_channel * channels
+
+
+def write_m3u(path, entries=500_000, seed=2, base_url='http://127.0.0.1:8080'):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('#EXTM3U\n')
+        for i in range(entries):
+            group = rng.choice(WORDS).title()
+            name = f"{_title(rng)}, {i}"
+            f.write(
+                f'#EXTINF:-1 tvg-id={quoteattr(f"ch{i}.bench")} tvg-name={quoteattr(name)} '
+                f'tvg-logo="{base_url}/logo/{i}.png" group-title={quoteattr(group)},{name}\n'
+                f'{base_url}/live/user/pass/{i}.ts\n'
+            )
+    return entries
+
+
+def make_vod_titles(count=200_000, seed=3):
+    """Return [(id, title)]; titles mix words, accents and years like a real catalog."""
+    rng = random.Random(seed)
+    accents = ('Amélie', 'Léon', 'Été', 'Noël', 'Côte', 'Français')
+    titles = []
+    for i in range(count):
+        title = _title(rng)
+        if rng.random() < 0.2:
+            title = f"{rng.choice(accents)} {title}"
+        titles.append((i, f"{title} ({rng.randint(1950, 2025)})"))
+    return titles
+
+
+def vod_queries(titles, count=500, seed=4):
+    """Realistic queries: word prefixes, full words, two-word phrases and infix fragments."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = rng.choice(titles)[1].split()
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(words[0][:rng.randint(2, 4)])
+        elif kind < 0.7:
+            queries.append(' '.join(words[:2]))
+        elif kind < 0.9:
+            queries.append(words[-1].strip('()'))
+        else:
+            word = max(words, key=len)
+            queries.append(word[1:4])
+    return queries
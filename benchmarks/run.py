@@ -0,0 +1,132 @@
+"""Run the offline benchmark suite and compare it against a stored baseline.
+
+    python -m benchmarks.run --scale small
+    python -m benchmarks.run --scale full --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.2
+
+Exits with status 1 when a metric regressed by more than the tolerance.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import traceback
+
+from benchmarks.cases import CASES, SCALES
+
+
+def _run_case(name, workdir, params, results):
+    # Expected failures (e.g. the stub's injected errors) would otherwise flood the output
+    logging.basicConfig(level=logging.ERROR)
+    try:
+        results.put((name, CASES[name](workdir, params), None))
+    except Exception:
+        results.put((name, None, traceback.format_exc()))
+
+
+def run_case(name, workdir, params, timeout):
+    """Run one case in a fresh process so peak RSS and caches are its own."""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_case, args=(name, workdir, params, results))
+    process.start()
+    try:
+        _, metrics, error = results.get(timeout=timeout)
+    except Exception:
+        metrics, error = None, f"no result after {timeout}s"
+    process.join(5)
+    if process.is_alive():
+        process.terminate()
+    if error:
+        logging.error(f"Benchmark {name} en échec:\n{error}")
+        return None
+    return {
+        f"{name}.{metric}": {'value': value, 'unit': unit, 'better': better}
+        for metric, (value, unit, better) in metrics.items()
+        if value is not None
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return [(metric, baseline value, value, change)] for metrics worse than baseline by more than tolerance."""
+    regressions = []
+    for metric, current in results['metrics'].items():
+        previous = baseline.get('metrics', {}).get(metric)
+        if not previous or not previous['value']:
+            continue
+        change = current['value'] / previous['value'] - 1
+        worse = change > tolerance if current['better'] == 'lower' else change < -tolerance
+        if worse:
+            regressions.append((metric, previous['value'], current['value'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CheckerIp offline benchmarks")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--cases', default=','.join(CASES), help="comma-separated subset of: " + ', '.join(CASES))
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'checkerip-bench'),
+                        help="where generated inputs are kept between runs")
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'results.json'))
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--save-baseline', help="also write the results to this path")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed relative slowdown (0.15 = 15%%)")
+    parser.add_argument('--timeout', type=float, default=1800, help="seconds allowed per case")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+
+    os.makedirs(args.workdir, exist_ok=True)
+    params = SCALES[args.scale]
+    results = {
+        'meta': {
+            'scale': args.scale,
+            'params': params,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'metrics': {},
+    }
+    failed = []
+    for name in args.cases.split(','):
+        if name not in CASES:
+            parser.error(f"unknown case {name}")
+        print(f"{name}...", flush=True)
+        metrics = run_case(name, args.workdir, params, args.timeout)
+        if metrics is None:
+            failed.append(name)
+            continue
+        results['metrics'].update(metrics)
+        for metric, entry in metrics.items():
+            print(f"  {metric:40} {entry['value']:14.3f} {entry['unit']}")
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+
+    status = 1 if failed else 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('scale') != args.scale:
+            print(f"warning: baseline was recorded at scale {baseline.get('meta', {}).get('scale')}")
+        regressions = compare(results, baseline, args.tolerance)
+        for metric, previous, current, change in regressions:
+            print(f"REGRESSION {metric}: {previous:.3f} -> {current:.3f} ({change:+.0%})")
+        if regressions:
+            status = 1
+        else:
+            print(f"No regression beyond {args.tolerance:.0%} against {args.baseline}")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
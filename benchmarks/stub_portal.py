@@ -0,0 +1,125 @@
+"""Local aiohttp portal stub with configurable latency and error rate.
+
+Serves the endpoints the app talks to: a plain portal page (health checks),
+Xtream player_api.php / get.php, a Stalker load.php and MPEG-TS streams. Run it
+standalone with `python -m benchmarks.stub_portal --port 8080`.
+"""
+import argparse
+import asyncio
+import random
+from aiohttp import web
+
+
+class StubPortal:
+
+    def __init__(self, latency=0.02, jitter=0.01, error_rate=0.0, channels=200, ports=(0,), seed=5):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.channels = channels
+        self.ports = ports
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.runner = None
+        self.urls = []
+
+    async def _delay(self):
+        self.requests += 1
+        await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            raise web.HTTPServiceUnavailable()
+
+    async def portal(self, request):
+        await self._delay()
+        return web.Response(text='<html><body>portal</body></html>', content_type='text/html')
+
+    async def player_api(self, request):
+        await self._delay()
+        action = request.query.get('action')
+        if action in ('get_live_categories', 'get_vod_categories'):
+            return web.json_response([{'category_id': i, 'category_name': f'Cat {i}'} for i in range(20)])
+        if action == 'get_live_streams':
+            return web.json_response([
+                {'stream_id': i, 'name': f'Channel {i}', 'category_id': i % 20, 'epg_channel_id': f'ch{i}.bench'}
+                for i in range(self.channels)
+            ])
+        if action == 'get_vod_streams':
+            return web.json_response([{'stream_id': i, 'name': f'Movie {i}', 'category_id': i % 20} for i in range(self.channels)])
+        return web.json_response({'user_info': {'auth': 1, 'status': 'Active'}})
+
+    async def get_playlist(self, request):
+        await self._delay()
+        host = f"http://{request.host}"
+        lines = ['#EXTM3U']
+        for i in range(self.channels):
+            lines.append(f'#EXTINF:-1 tvg-id="ch{i}.bench" group-title="Cat {i % 20}",Channel {i}')
+            lines.append(f'{host}/live/user/pass/{i}.ts')
+        return web.Response(text='\n'.join(lines) + '\n', content_type='audio/x-mpegurl')
+
+    async def stalker(self, request):
+        await self._delay()
+        action = request.query.get('action')
+        if action == 'handshake':
+            return web.json_response({'js': {'token': 'bench-token'}})
+        if action == 'get_genres':
+            return web.json_response({'js': [{'id': i, 'title': f'Cat {i}'} for i in range(20)]})
+        if action == 'get_all_channels':
+            return web.json_response({'js': {'data': [
+                {'id': i, 'name': f'Channel {i}', 'tv_genre_id': i % 20, 'cmd': f'ffmpeg http://{request.host}/live/{i}.ts'}
+                for i in range(self.channels)
+            ]}})
+        return web.json_response({'js': {}})
+
+    async def live(self, request):
+        await self._delay()
+        # A few MPEG-TS packets, enough for the stream prober
+        return web.Response(body=bytes([0x47] + [0] * 187) * 64, content_type='video/mp2t')
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/', self.portal)
+        app.router.add_get('/c/', self.portal)
+        app.router.add_get('/player_api.php', self.player_api)
+        app.router.add_get('/get.php', self.get_playlist)
+        app.router.add_get('/portal.php', self.stalker)
+        app.router.add_get('/stalker_portal/server/load.php', self.stalker)
+        app.router.add_get('/live/{path:.*}', self.live)
+        return app
+
+    async def start(self):
+        """Start listening; each port in ports is a separate host as far as per-host limits go."""
+        self.runner = web.AppRunner(self.app(), access_log=None)
+        await self.runner.setup()
+        for port in self.ports:
+            await web.TCPSite(self.runner, '127.0.0.1', port).start()
+        self.urls = [f"http://127.0.0.1:{address[1]}" for address in self.runner.addresses]
+        return self.urls
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+async def _serve(args):
+    portal = StubPortal(args.latency, args.jitter, args.error_rate, args.channels, (args.port,))
+    print('\n'.join(await portal.start()), flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await portal.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--channels', type=int, default=200)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,207 @@
+"""Headless command line for cron jobs and small hosts; prints JSON on stdout.
+
+    python -m checkerip epg refresh [URL ...]
+    python -m checkerip epg match PLAYLIST [--guide FILE ...]
+    python -m checkerip health [--all]
+    python -m checkerip vod index SOURCE [--output vod_cache.jsonl]
+
+Only the network, storage and parsing modules are imported: no Tk, VLC or
+Selenium, so it runs on a box without a display or a browser.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from urllib.parse import parse_qs, urlparse
+
+__version__ = "1.0.0"
+
+
+def load_config(path):
+    # Same layers as the GUI (defaults, config.json, config.yaml, CHECKERIP_* env vars), never watched
+    from config_manager import ConfigManager
+    import http_cache
+    import http_client
+    config_manager = ConfigManager(config_file=path)
+    http_client.configure(
+        connect_timeout=config_manager.get('http_connect_timeout', 10),
+        read_timeout=config_manager.get('http_read_timeout', 60),
+        limit_per_host=config_manager.get('http_connections_per_host', 8),
+    )
+    http_cache.configure(
+        directory=config_manager.get('http_cache_dir', '.http_cache'),
+        max_bytes=config_manager.get('http_cache_max_mb', 512) * 1024 * 1024,
+        ttl_overrides=config_manager.get('http_cache_ttl') or {},
+        stale_while_revalidate=config_manager.get('http_cache_stale_seconds', 24 * 3600),
+    )
+    return config_manager
+
+
+async def _close_http():
+    from http_client import get_client
+    await get_client().close()
+
+
+def epg_refresh(args, config_manager):
+    from epg import EpgManager
+    from epg_store import EpgStore
+    urls = args.urls or config_manager.get('epg_urls') or []
+    if not urls:
+        raise SystemExit("no EPG source: pass URLs or set epg_urls in the configuration")
+    store = EpgStore(args.db)
+    try:
+        manager = EpgManager(store=store)
+        for url in urls:
+            manager.add_epg_url(url)
+
+        async def run():
+            try:
+                return await manager.refresh_all_async()
+            finally:
+                await _close_http()
+
+        started = time.perf_counter()
+        report = asyncio.run(run())
+    finally:
+        store.close()
+    for entry in report.values():
+        entry.pop('path', None)
+        entry.pop('validators', None)
+    failed = [url for url, entry in report.items() if entry['status'] == 'error']
+    return {'seconds': time.perf_counter() - started, 'sources': report, 'failed': failed}, 1 if failed else 0
+
+
+def epg_match(args, config_manager):
+    from epg_matcher import build_matcher
+    from epg_store import EpgStore
+    from m3u_parser import M3uParser
+    store = EpgStore(args.db)
+    try:
+        started = time.perf_counter()
+        matcher = build_matcher(store, args.guide)
+        built = time.perf_counter() - started
+        entries = list(M3uParser(args.playlist))
+        started = time.perf_counter()
+        matches = matcher.match_all((entry.tvg_name or entry.name, entry.tvg_id) for entry in entries)
+        matched = time.perf_counter() - started
+    finally:
+        store.close()
+    channels = [
+        {'name': entry.name, 'tvg_id': entry.tvg_id, 'channel_id': match.channel_id if match else None,
+         'method': match.method if match else None, 'score': match.score if match else None}
+        for entry, match in zip(entries, matches)
+    ]
+    report = {
+        'index_seconds': built,
+        'match_seconds': matched,
+        'guide_channels': len(matcher),
+        'entries': len(entries),
+        'unmatched': sum(match is None for match in matches),
+        'channels': channels,
+    }
+    return report, 0
+
+
+def health(args, config_manager):
+    from subscription_store import SubscriptionStore
+    from subscriptions import SubscriptionManager
+    store = SubscriptionStore(args.db)
+    try:
+        manager = SubscriptionManager(store=store)
+
+        async def run():
+            try:
+                return [result async for result in manager.iter_connectivity_async(due_only=not args.all)]
+            finally:
+                await _close_http()
+
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        store.flush()
+        subscriptions = [
+            dict(manager.health_summary(url, device['mac']), url=url, mac=device['mac'], type=device.get('type'), active=device['active'])
+            for url, devices in manager.subscriptions.items()
+            for device in devices
+        ]
+    finally:
+        store.close()
+    report = {
+        'seconds': time.perf_counter() - started,
+        'checked': [result._asdict() for result in results],
+        'subscriptions': subscriptions,
+    }
+    return report, 1 if any(not result.ok for result in results) else 0
+
+
+def vod_source(location):
+    from vod import CachedVodSource, M3uVodSource, XtreamVodSource
+    parsed = urlparse(location)
+    query = parse_qs(parsed.query)
+    if parsed.scheme in ('http', 'https') and 'username' in query and 'password' in query:
+        return XtreamVodSource(f"{parsed.scheme}://{parsed.netloc}", query['username'][0], query['password'][0])
+    if location.endswith('.jsonl'):
+        return CachedVodSource(location)
+    return M3uVodSource(location)
+
+
+def vod_index(args, config_manager):
+    from vod import VodManager
+    manager = VodManager()
+    started = time.perf_counter()
+    count = manager.load_source(vod_source(args.source), background=False)
+    loaded = time.perf_counter() - started
+    if count:
+        manager.save_cache(args.output)
+    return {'seconds': loaded, 'items': count, 'output': args.output if count else None}, 0 if count else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='checkerip', description="CheckerIp headless commands (JSON on stdout)")
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('-v', '--verbose', action='store_true', help="log progress on stderr")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    epg_parser = commands.add_parser('epg', help="electronic programme guide")
+    epg_commands = epg_parser.add_subparsers(dest='epg_command', required=True)
+    refresh = epg_commands.add_parser('refresh', help="download, parse and merge every EPG source")
+    refresh.add_argument('urls', nargs='*', help="XMLTV sources (default: epg_urls from the configuration)")
+    refresh.add_argument('--db', default='epg.db')
+    refresh.set_defaults(handler=epg_refresh)
+    match = epg_commands.add_parser('match', help="link playlist channels to guide channels")
+    match.add_argument('playlist', help="M3U file or URL")
+    match.add_argument('--guide', action='append', default=[], help="XMLTV file declaring <channel> names (repeatable)")
+    match.add_argument('--db', default='epg.db')
+    match.set_defaults(handler=epg_match)
+
+    health_parser = commands.add_parser('health', help="check subscriptions that are due, and report uptime/latency")
+    health_parser.add_argument('--all', action='store_true', help="check every subscription, not only those due")
+    health_parser.add_argument('--db', default='subscriptions.db')
+    health_parser.set_defaults(handler=health)
+
+    vod_parser = commands.add_parser('vod', help="video on demand catalog")
+    vod_commands = vod_parser.add_subparsers(dest='vod_command', required=True)
+    index = vod_commands.add_parser('index', help="load a catalog and write it as a local cache")
+    index.add_argument('source', help="Xtream URL with username/password, M3U file or URL, or a .jsonl cache")
+    index.add_argument('--output', default='vod_cache.jsonl')
+    index.set_defaults(handler=vod_index)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    config_manager = load_config(args.config)
+    try:
+        report, status = args.handler(args, config_manager)
+    finally:
+        config_manager.close()
+    json.dump(report, sys.stdout, indent=2, ensure_ascii=False, default=str)
+    sys.stdout.write('\n')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
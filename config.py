@@ -1,10 +1,13 @@
 import json
+import logging
 import os
-import requests
-import pyperclip
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 __version__ = "1.0.0"
 
+SOURCE_URL = 'http://example.com/get_server_mac'
+
 def load_config(file_path=None):
     if file_path is None:
         file_path = os.path.join(os.path.dirname(__file__), 'config.json')
@@ -21,44 +24,51 @@ def get_server_url(config):
 def get_mac_address(config):
     return config.get('mac_address')
 
-def load_additional_sources():
-    server_url = None
-    mac_address = None
+def _split_pair(text):
+    """Parse 'url,mac' on one line, or the url and the mac on the first two lines."""
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    if lines and ',' in lines[0]:
+        data = lines[0].split(',')
+        return data[0].strip(), data[1].strip()
+    if len(lines) >= 2:
+        return lines[0], lines[1]
+    return None
 
-    try:
-        clipboard_data = pyperclip.paste()
-        if clipboard_data:
-            data = clipboard_data.split(',')
-            if len(data) >= 2:
-                server_url, mac_address = data[:2]
-            else:
-                print("Not enough values in clipboard data")
-    except Exception as e:
-        print(f"Error loading from clipboard: {e}")
+def _from_clipboard(deadline):
+    import pyperclip  # only needed when the clipboard source is used
+    return _split_pair(pyperclip.paste() or '')
+
+def _from_file(deadline, path='server_mac.txt'):
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return _split_pair(f.read())
 
-    if not server_url or not mac_address:
-        try:
-            with open('server_mac.txt', 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-                if lines:
-                    data = lines[0].strip().split(',')
-                    if len(data) >= 2:
-                        server_url, mac_address = data[:2]
-                    else:
-                        print("Not enough values in file data")
-        except Exception as e:
-            print(f"Error loading from file: {e}")
+def _from_webpage(deadline, url=SOURCE_URL):
+    from http_client import get_client
+    response = get_client().sync_session().get(url, timeout=max(0.1, deadline - time.monotonic()))
+    return _split_pair(response.text) if response.status_code == 200 else None
 
-    if not server_url or not mac_address:
-        try:
-            response = requests.get('http://example.com/get_server_mac')
-            if response.status_code == 200:
-                data = response.text.split(',')
-                if len(data) >= 2:
-                    server_url, mac_address = data[:2]
-                else:
-                    print("Not enough values in webpage data")
-        except Exception as e:
-            print(f"Error loading from webpage: {e}")
+SOURCES = (('clipboard', _from_clipboard), ('file', _from_file), ('webpage', _from_webpage))
 
-    return server_url, mac_address
+def load_additional_sources(deadline=3.0, sources=SOURCES):
+    """Return (server_url, mac_address) from the first source, in priority order, that has both.
+
+    All sources are queried at once; the result of a source is used as soon
+    as every higher-priority source has failed, and sources still running
+    when the deadline expires are ignored.
+    """
+    expires = time.monotonic() + deadline
+    executor = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix='config-source')
+    try:
+        futures = [(name, executor.submit(resolve, expires)) for name, resolve in sources]
+        for name, future in futures:
+            try:
+                pair = future.result(timeout=max(0, expires - time.monotonic()))
+            except Exception as e:
+                logging.warning(f"Source de configuration {name} indisponible: {str(e) or type(e).__name__}")
+                continue
+            if pair and all(pair):
+                logging.info(f"Serveur et adresse MAC chargés depuis la source {name}")
+                return pair
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return None, None
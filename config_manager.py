@@ -1,24 +1,208 @@
-import yaml
+import atexit
+import json
+import logging
 import os
+import tempfile
+import threading
+from startup import lazy_import
+
+# Executed on first use, when the yaml layer is read or written
+yaml = lazy_import('yaml')
+
+# Lowest to highest precedence; update() writes to the yaml layer
+LAYERS = ('defaults', 'sources', 'json', 'yaml', 'env')
 
 class ConfigManager:
-    def __init__(self, config_file='config.yaml'):
+    """Configuration merged from defaults, optional sources, config.json, config.yaml and env vars.
+
+    Parsed files are cached by (mtime, size) and only re-read when they
+    change. watch() polls both files and hot-reloads external edits,
+    notifying listeners with the keys whose merged value changed. update()
+    only touches memory; the YAML file is rewritten atomically once updates
+    have stopped arriving for write_delay seconds (or on flush()/exit).
+    """
+
+    def __init__(self, config_file='config.yaml', json_file='config.json', env_prefix='CHECKERIP_',
+                 defaults=None, write_delay=1.0):
         self.config_file = config_file
+        self.json_file = json_file
+        self.env_prefix = env_prefix
+        self.write_delay = write_delay
+        self.layers = {name: {} for name in LAYERS}
+        self.layers['defaults'] = dict(defaults or {})
+        self.listeners = []
+        self._lock = threading.RLock()
+        self._cache = {}
+        self._yaml_data = {}
+        self._dirty_keys = set()
+        self._write_timer = None
+        self._watcher = None
+        self._stop_watching = threading.Event()
         self.config = self.load_config()
+        atexit.register(self.flush)
 
-    def load_config(self):
-        if not os.path.isfile(self.config_file):
-            raise FileNotFoundError(f"Configuration file {self.config_file} not found.")
+    def _stamp(self, path):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _read_cached(self, path, parse):
+        stamp = self._stamp(path)
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8') as file:
+            data = parse(file) or {}
+        self._cache[path] = (stamp, data)
+        return data
+
+    def _parse_yaml(self, file):
         try:
-            with open(self.config_file, 'r') as file:
-                return yaml.safe_load(file)
+            return yaml.safe_load(file)
         except yaml.YAMLError as e:
             raise ValueError(f"Error parsing configuration file: {e}")
 
+    def _clean(self, data):
+        # Template values such as "YOUR_SERVER_URL" count as unset, so lower layers can fill them
+        return {key: value for key, value in data.items() if not (isinstance(value, str) and value.startswith('YOUR_'))}
+
+    def _env_layer(self):
+        layer = {}
+        for name, value in os.environ.items():
+            if name.startswith(self.env_prefix):
+                try:
+                    value = yaml.safe_load(value)  # "8" -> 8, "true" -> True
+                except yaml.YAMLError:
+                    pass
+                layer[name[len(self.env_prefix):].lower()] = value
+        return layer
+
+    def _merge(self):
+        merged = {}
+        for name in LAYERS:
+            merged.update(self.layers[name])
+        return merged
+
+    def load_config(self):
+        if not os.path.isfile(self.config_file):
+            raise FileNotFoundError(f"Configuration file {self.config_file} not found.")
+        with self._lock:
+            data = dict(self._read_cached(self.config_file, self._parse_yaml))
+            # Updates not yet written survive a reload
+            for key in self._dirty_keys:
+                data[key] = self._yaml_data[key]
+            self._yaml_data = data
+            self.layers['yaml'] = self._clean(data)
+            if self.json_file and os.path.isfile(self.json_file):
+                try:
+                    self.layers['json'] = self._clean(self._read_cached(self.json_file, json.load))
+                except ValueError as e:
+                    logging.error(f"Fichier de configuration {self.json_file} invalide: {e}")
+            else:
+                self.layers['json'] = {}
+            self.layers['env'] = self._env_layer()
+            return self._merge()
+
     def get(self, key, default=None):
         return self.config.get(key, default)
 
+    def source_of(self, key):
+        """Name of the layer the current value of key comes from, or None."""
+        for name in reversed(LAYERS):
+            if key in self.layers[name]:
+                return name
+        return None
+
     def update(self, key, value):
-        self.config[key] = value
-        with open(self.config_file, 'w') as file:
-            yaml.safe_dump(self.config, file)
+        with self._lock:
+            self._yaml_data[key] = value
+            self.layers['yaml'][key] = value
+            self._dirty_keys.add(key)
+            self.config = self._merge()
+            # Coalesce bursts of updates into a single write
+            if self._write_timer is not None:
+                self._write_timer.cancel()
+            self._write_timer = threading.Timer(self.write_delay, self.flush)
+            self._write_timer.daemon = True
+            self._write_timer.start()
+
+    def flush(self):
+        """Write pending updates now, atomically (temp file + rename)."""
+        with self._lock:
+            if self._write_timer is not None:
+                self._write_timer.cancel()
+                self._write_timer = None
+            if not self._dirty_keys:
+                return
+            directory = os.path.dirname(os.path.abspath(self.config_file))
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.config-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    yaml.safe_dump(self._yaml_data, file, sort_keys=False, allow_unicode=True)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp_path, self.config_file)
+            except OSError as e:
+                logging.error(f"Échec de l'écriture de {self.config_file}: {e}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return
+            self._dirty_keys.clear()
+            # Our own write must not look like an external edit to the watcher
+            self._cache[self.config_file] = (self._stamp(self.config_file), dict(self._yaml_data))
+
+    def add_listener(self, callback):
+        """callback(changed) is called from the watcher thread with {key: new value} after a reload."""
+        self.listeners.append(callback)
+
+    def _set_config(self, config):
+        previous, self.config = self.config, config
+        changed = {key: config.get(key) for key in previous.keys() | config.keys() if previous.get(key) != config.get(key)}
+        if changed:
+            logging.info(f"Configuration rechargée, clés modifiées: {sorted(changed)}")
+            for callback in list(self.listeners):
+                try:
+                    callback(changed)
+                except Exception as e:
+                    logging.error(f"Erreur dans un écouteur de configuration: {e}")
+        return changed
+
+    def reload(self):
+        """Re-read files changed on disk; returns the changed keys."""
+        try:
+            config = self.load_config()
+        except (OSError, ValueError) as e:
+            logging.error(f"Rechargement de la configuration impossible: {e}")
+            return {}
+        return self._set_config(config)
+
+    def watch(self, interval=2.0):
+        """Poll the configuration files for external edits in a background thread."""
+        if self._watcher is not None:
+            return
+
+        def poll():
+            while not self._stop_watching.wait(interval):
+                self.reload()
+
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=poll, name='config-watcher', daemon=True)
+        self._watcher.start()
+
+    def resolve_sources(self, deadline=3.0):
+        """Fill server_url/mac_address from clipboard, server_mac.txt or the web, in the background."""
+        from config import load_additional_sources
+
+        def resolve():
+            server_url, mac_address = load_additional_sources(deadline)
+            if server_url and mac_address:
+                with self._lock:
+                    self.layers['sources'] = {'server_url': server_url, 'mac_address': mac_address}
+                    config = self._merge()
+                self._set_config(config)
+
+        threading.Thread(target=resolve, name='config-sources', daemon=True).start()
+
+    def close(self):
+        self._stop_watching.set()
+        self._watcher = None
+        self.flush()
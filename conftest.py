@@ -0,0 +1,2 @@
+# test_chromedriver.py is a manual check against a local ChromeDriver install, not a pytest module
+collect_ignore = ['test_chromedriver.py']
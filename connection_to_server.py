@@ -1,8 +1,15 @@
-import aiohttp
 import logging
 import asyncio
-from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.common.exceptions import WebDriverException
+from urllib.parse import urlparse
+from error_handling import ConnectionError
+from http_client import get_client
+from health_check import RETRIES, TIMEOUTS
+from portal_client import fetch_portal_content
+from startup import lazy_import
+
+aiohttp = lazy_import('aiohttp')
+
+DRAIN_LIMIT = 64 * 1024
 
 class ServerConnection:
     def __init__(self, server_url, mac_address=None, headers=None):
@@ -13,27 +20,43 @@ class ServerConnection:
             'X-MAC-Address': self.mac_address
         }
 
+    async def check_once(self):
+        """Single request to the portal; True on HTTP 200. Network errors propagate to the caller."""
+        session = await get_client().session()
+        async with session.get(self.server_url, headers=self.headers) as response:
+            logging.info(f"Response status: {response.status} for MAC {self.mac_address} at {self.server_url}")
+            if response.content_length is not None and response.content_length <= DRAIN_LIMIT:
+                await response.read()  # a fully read response lets the connection be reused
+            if response.status == 200:
+                return True
+            else:
+                logging.warning(f"Non-200 status code: {response.status}")
+                return False
+
     async def connect(self):
         retries = 3
+        host = urlparse(self.server_url).netloc
         for attempt in range(retries):
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(self.server_url, headers=self.headers, timeout=60) as response:
-                        logging.info(f"Response status: {response.status} for MAC {self.mac_address} at {self.server_url}")
-                        if response.status == 200:
-                            return True
-                        else:
-                            logging.warning(f"Non-200 status code: {response.status}")
-                            return False
+                return await self.check_once()
             except asyncio.TimeoutError:
                 logging.error(f"Timeout error for MAC {self.mac_address} at {self.server_url}")
+                TIMEOUTS.inc(operation='connect', host=host)
             except aiohttp.ClientError as e:
                 logging.error(f"Client error for MAC {self.mac_address} at {self.server_url}: {e}")
+            if attempt < retries - 1:
+                RETRIES.inc(operation='connect', host=host)
             await asyncio.sleep(2 ** attempt)  # Exponential backoff
 
         raise ConnectionError(f"Failed to connect to {self.server_url} after {retries} attempts")
 
-    def fetch_server_content(self, driver: WebDriver):
+    async def fetch_content_async(self, sub_type=None):
+        """Fetch categories and channels through the portal's own API (Xtream, MAC/Stalker or M3U)."""
+        return await fetch_portal_content(self.server_url, self.mac_address, sub_type)
+
+    def fetch_server_content(self, driver):
+        # Headless Chrome fallback, only used when explicitly enabled (chrome_fallback in config.yaml)
+        from selenium.common.exceptions import WebDriverException
         try:
             driver.get(self.server_url)
             content = driver.page_source
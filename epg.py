@@ -1,65 +1,494 @@
-import requests
+import asyncio
 import logging
+import time
 import zipfile
 import os
+import io
+import json
+import lzma
+import struct
+import zlib
+import calendar
+import functools
+import itertools
 import xml.etree.ElementTree as ET
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from epg_store import EpgStore
+from http_client import get_client
+from http_cache import get_cache, header, release
+import metrics
+from startup import lazy_import
+
+aiohttp = lazy_import('aiohttp')
+requests = lazy_import('requests')
 
 __version__ = "2.0.0"
 
-class EpgManager:
+CHUNK_SIZE = 64 * 1024
+
+EPG_PARSE_SECONDS = metrics.histogram('checkerip_epg_parse_seconds', "Time to parse (and import) one EPG guide", ('source',))
+EPG_PROGRAMMES = metrics.counter('checkerip_epg_programmes_total', "Programmes parsed from EPG guides", ('source',))
+EPG_PARSE_RATE = metrics.gauge('checkerip_epg_programmes_per_second', "Parse rate of the last import of each guide", ('source',))
+
+Programme = namedtuple('Programme', ['channel', 'start', 'stop', 'title', 'desc'])
+
+
+@functools.lru_cache(maxsize=4096)
+def _day_epoch(date_digits):
+    return calendar.timegm((int(date_digits[:4]), int(date_digits[4:6]), int(date_digits[6:8]), 0, 0, 0))
+
+
+@functools.lru_cache(maxsize=256)
+def _offset_seconds(offset):
+    if len(offset) != 5 or offset[0] not in '+-':
+        return 0
+    shift = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    return shift if offset[0] == '+' else -shift
+
+
+def parse_xmltv_time(value):
+    """Convert an XMLTV timestamp such as '20241211120000 +0100' to a UTC epoch.
+
+    Day and timezone offsets are cached, so a guide only pays for a handful of
+    calendar conversions instead of one strptime per timestamp.
+    """
+    if not value:
+        return None
+    digits, _, offset = value.strip().partition(' ')
+    if len(digits) < 8 or not digits[:14].isdigit():
+        raise ValueError(f"Horodatage XMLTV invalide: {value!r}")
+    digits = digits[:14].ljust(14, '0')
+    return (_day_epoch(digits[:8]) + int(digits[8:10]) * 3600 + int(digits[10:12]) * 60 + int(digits[12:14])
+            - _offset_seconds(offset))
+
+
+def iter_programmes(source):
+    """Stream programmes out of an XMLTV file path or file object in a single pass.
+
+    Elements are cleared from the tree as soon as they have been read, so memory
+    stays bounded whatever the size of the guide.
+    """
+    context = ET.iterparse(source, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event != 'end':
+            continue
+        if elem.tag == 'programme':
+            try:
+                start = parse_xmltv_time(elem.get('start'))
+                stop = parse_xmltv_time(elem.get('stop'))
+            except ValueError as e:
+                # One bad timestamp must not abort (and roll back) the whole guide
+                logging.warning(f"Programme ignoré sur {elem.get('channel')}: {e}")
+            else:
+                yield Programme(elem.get('channel'), start, stop, elem.findtext('title'), elem.findtext('desc'))
+            root.clear()
+        elif elem.tag == 'channel':
+            root.clear()
+
+
+def iter_channels(source):
+    """Stream (channel_id, [display name, ...]) out of an XMLTV file path or file object.
+
+    XMLTV lists every <channel> before the programmes, so parsing stops at the
+    first programme.
+    """
+    context = ET.iterparse(source, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if elem.tag == 'programme':
+            return
+        if event == 'end' and elem.tag == 'channel':
+            yield elem.get('id'), [name.text.strip() for name in elem.iter('display-name') if name.text and name.text.strip()]
+            root.clear()
+
+
+def iter_channel_programmes(source):
+    """Group streamed programmes by channel, yielding (channel_id, [Programme, ...]).
+
+    XMLTV guides list each channel's programmes contiguously, so only one channel
+    is held in memory at a time. A channel split across the file yields one group
+    per run.
+    """
+    for channel_id, programmes in itertools.groupby(iter_programmes(source), key=lambda p: p.channel):
+        yield channel_id, list(programmes)
+
+
+class ChunkStream(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = memoryview(next(self.chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def _decompress_chunks(chunks, decompressor):
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if hasattr(decompressor, 'flush'):
+        data = decompressor.flush()
+        if data:
+            yield data
+
+
+def _iter_zip_members(chunks):
+    """Yield (name, chunk iterator) for each member of a zip archive read sequentially.
+
+    Only the local file headers are used, so the archive never has to be seekable
+    or stored on disk. Each member iterator must be consumed before the next one.
+    """
+    chunks = iter(chunks)
+    buffer = bytearray()
+
+    def fill(size):
+        while len(buffer) < size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return False
+            buffer.extend(chunk)
+        return True
+
+    def member_data(flags, method, compressed_size):
+        if method == zipfile.ZIP_DEFLATED:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            while not decompressor.eof:
+                if not buffer and not fill(1):
+                    raise zipfile.BadZipFile("Archive zip tronquée")
+                data = decompressor.decompress(bytes(buffer))
+                buffer.clear()
+                if data:
+                    yield data
+            buffer[:0] = decompressor.unused_data
+        elif method == zipfile.ZIP_STORED and not flags & 0x08:
+            while compressed_size:
+                if not buffer and not fill(1):
+                    raise zipfile.BadZipFile("Archive zip tronquée")
+                size = min(compressed_size, len(buffer))
+                yield bytes(buffer[:size])
+                del buffer[:size]
+                compressed_size -= size
+        else:
+            raise zipfile.BadZipFile(f"Méthode de compression zip non supportée en flux: {method}")
+        if flags & 0x08:
+            # Data descriptor, with or without its optional signature.
+            fill(16)
+            del buffer[:16 if buffer[:4] == b'PK\x07\x08' else 12]
+
+    while fill(30) and buffer[:4] == b'PK\x03\x04':
+        flags, method = struct.unpack('<HH', buffer[6:10])
+        compressed_size, = struct.unpack('<I', buffer[18:22])
+        name_length, extra_length = struct.unpack('<HH', buffer[26:30])
+        fill(30 + name_length + extra_length)
+        name = bytes(buffer[30:30 + name_length]).decode('utf-8', 'replace')
+        del buffer[:30 + name_length + extra_length]
+        data = member_data(flags, method, compressed_size)
+        yield name, data
+        for _ in data:
+            pass
+
+
+def open_xmltv_stream(chunks, name=None):
+    """Yield (name, file object) for each XMLTV document in a stream of bytes.
+
+    Plain XML, gzip, xz and zip sources are detected from their magic bytes and
+    decompressed on the fly, so only one chunk is held in memory at a time.
+    """
+    chunks = iter(chunks)
+    head = b''
+    while len(head) < 6:
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        head += chunk
+    chunks = itertools.chain([head], chunks)
+    if head.startswith(b'PK\x03\x04'):
+        for member, data in _iter_zip_members(chunks):
+            if member.endswith('.xml'):
+                yield member, io.BufferedReader(ChunkStream(data), CHUNK_SIZE)
+    elif head.startswith(b'\x1f\x8b'):
+        yield name, io.BufferedReader(ChunkStream(_decompress_chunks(chunks, zlib.decompressobj(16 + zlib.MAX_WBITS))), CHUNK_SIZE)
+    elif head.startswith(b'\xfd7zXZ\x00'):
+        yield name, io.BufferedReader(ChunkStream(_decompress_chunks(chunks, lzma.LZMADecompressor())), CHUNK_SIZE)
+    else:
+        yield name, io.BufferedReader(ChunkStream(chunks), CHUNK_SIZE)
+
+
+def iter_file_chunks(file_path, chunk_size=CHUNK_SIZE):
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def parse_guide_file(file_path):
+    """Parse a (possibly compressed) XMLTV file into {channel_id: [Programme, ...]}.
+
+    Module-level so it can run in a worker process.
+    """
+    guide = defaultdict(list)
+    for name, stream in open_xmltv_stream(iter_file_chunks(file_path), file_path):
+        for channel_id, programmes in iter_channel_programmes(stream):
+            guide[channel_id].extend(programmes)
+    return dict(guide)
+
+
+class GuideMerger:
+    """Merges guides one at a time, in any order; lower priority values win.
+
+    Within a channel a programme is dropped if it overlaps one already kept
+    from a source of equal or higher priority, and replaces the lower-priority
+    programmes it overlaps, so each guide can be released as soon as it has
+    been added instead of holding every source until the end. Added in
+    priority order the result is exact; out of order, a lower-priority
+    programme rejected earlier does not come back into a gap left by one
+    that was displaced later.
+    """
 
     def __init__(self):
+        self.channels = {}  # channel_id -> (starts, programmes, priorities), sorted and non-overlapping
+        self.sources = 0
+
+    def add(self, priority, guide):
+        self.sources += 1
+        for channel_id, programmes in guide.items():
+            starts, accepted, priorities = self.channels.setdefault(channel_id, ([], [], []))
+            for programme in programmes:
+                if programme.start is None or programme.stop is None:
+                    continue
+                # Kept programmes never overlap, so those overlapping this one are a contiguous run
+                high = bisect_left(starts, programme.stop)
+                low = high
+                while low and accepted[low - 1].stop > programme.start:
+                    low -= 1
+                if any(kept <= priority for kept in priorities[low:high]):
+                    continue
+                starts[low:high] = [programme.start]
+                accepted[low:high] = [programme]
+                priorities[low:high] = [priority]
+
+    def result(self):
+        """{channel_id: [Programme, ...]} sorted by start."""
+        return {channel_id: accepted for channel_id, (_, accepted, _) in self.channels.items()}
+
+
+def merge_guides(guides):
+    """Merge [(priority, guide), ...] into one guide; lower priority values win (see GuideMerger)."""
+    merger = GuideMerger()
+    for priority, guide in sorted(guides, key=lambda source: source[0]):
+        merger.add(priority, guide)
+    return merger.result()
+
+
+class EpgManager:
+
+    def __init__(self, store=None, http_cache=None):
         self.epg_urls = []
+        self.source_priority = {}
+        self.store = store if store is not None else EpgStore()
+        self.http_cache = http_cache
 
-    def download_and_extract_zip(self, url, extract_to='xmltv_data'):
-        try:
-            # Step 1: Download the zip file
-            response = requests.get(url)
-            response.raise_for_status()
-            zip_path = os.path.join(extract_to, 'xmltv.zip')
-            os.makedirs(extract_to, exist_ok=True)
-            with open(zip_path, 'wb') as f:
-                f.write(response.content)
-            logging.info(f"Downloaded zip file from {url}")
-
-            # Step 2: Decompress the zip file
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_to)
-            logging.info(f"Extracted zip file to {extract_to}")
-            os.remove(zip_path)  # Clean up zip file after extraction
-
-            # Step 3: Process the XML files
-            self.process_epg_files(extract_to)
+    def _conditional_headers(self, url):
+        validators = json.loads(self.store.get_meta(f"validators:{url}", '{}'))
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def _save_validators(self, url, headers):
+        self.store.set_meta(f"validators:{url}", json.dumps({
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }))
+
+    def _record_parse(self, source, count, seconds):
+        EPG_PROGRAMMES.inc(count, source=source)
+        if seconds > 0 and count:
+            EPG_PARSE_RATE.set(count / seconds, source=source)
 
+    def download_epg(self, url):
+        """Stream a guide from url into the store, skipping it when the server reports it unchanged."""
+        with metrics.span('epg.download', EPG_PARSE_SECONDS, source=url) as attributes:
+            count = self._download_epg(url)
+            attributes['programmes'] = count
+        self._record_parse(url, count, attributes['seconds'])
+        return count
+
+    def _download_epg(self, url):
+        headers = self._conditional_headers(url)
+        count = 0
+        try:
+            client = get_client()
+            with client.sync_session().get(url, headers=headers, stream=True, timeout=client.sync_timeout) as response:
+                if response.status_code == 304:
+                    logging.info(f"Guide EPG inchangé depuis le dernier import: {url}")
+                    return 0
+                response.raise_for_status()
+                for name, stream in open_xmltv_stream(response.iter_content(CHUNK_SIZE), url):
+                    count += self.store.import_guide(iter_channel_programmes(stream))
+                self._save_validators(url, response.headers)
+            logging.info(f"{count} programmes importés depuis {url}")
         except requests.exceptions.RequestException as e:
-            logging.error(f"Erreur lors du téléchargement du fichier zip depuis {url}: {e}")
-        except zipfile.BadZipFile as e:
-            logging.error(f"Erreur lors de la décompression du fichier zip: {e}")
+            logging.error(f"Erreur lors du téléchargement du guide EPG depuis {url}: {e}")
+        except (zipfile.BadZipFile, zlib.error, lzma.LZMAError) as e:
+            logging.error(f"Erreur lors de la décompression du guide EPG {url}: {e}")
+        except (ET.ParseError, ValueError) as e:
+            logging.error(f"Erreur lors de l'analyse du guide EPG {url}: {e}")
+        return count
 
     def process_epg_files(self, directory):
         for filename in os.listdir(directory):
-            if filename.endswith(".xml"):
+            if filename.endswith((".xml", ".gz", ".xz", ".zip")):
                 file_path = os.path.join(directory, filename)
                 self.parse_epg_file(file_path)
 
     def parse_epg_file(self, file_path):
+        with metrics.span('epg.parse', EPG_PARSE_SECONDS, source=file_path) as attributes:
+            count = self._parse_epg_file(file_path)
+            attributes['programmes'] = count
+        self._record_parse(file_path, count, attributes['seconds'])
+        return count
+
+    def _parse_epg_file(self, file_path):
+        count = 0
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            for channel in root.findall('channel'):
-                channel_id = channel.get('id')
-                for programme in root.findall(f"programme[@channel='{channel_id}']"):
-                    start = programme.get('start')
-                    stop = programme.get('stop')
-                    title = programme.find('title').text
-                    logging.info(f"Channel: {channel_id}, Start: {start}, Stop: {stop}, Title: {title}")
-        except ET.ParseError as e:
+            for name, stream in open_xmltv_stream(iter_file_chunks(file_path), file_path):
+                count += self.store.import_guide(iter_channel_programmes(stream))
+            logging.info(f"{count} programmes analysés dans {file_path}")
+        except (zipfile.BadZipFile, zlib.error, lzma.LZMAError) as e:
+            logging.error(f"Erreur lors de la décompression du fichier {file_path}: {e}")
+        except (ET.ParseError, ValueError) as e:
             logging.error(f"Erreur lors de l'analyse du fichier XML {file_path}: {e}")
+        return count
 
     def load_epg(self, epg_url):
-        self.download_and_extract_zip(epg_url)
+        return self.download_epg(epg_url)
 
-    def add_epg_url(self, epg_url):
+    def add_epg_url(self, epg_url, priority=None):
         if epg_url and epg_url not in self.epg_urls:
             self.epg_urls.append(epg_url)
+            self.source_priority[epg_url] = len(self.epg_urls) if priority is None else priority
             logging.info(f"URL EPG ajoutée: {epg_url}")
+
+    def refresh_all(self):
+        return asyncio.run(self.refresh_all_async())
+
+    async def refresh_all_async(self):
+        """Download every registered source concurrently, parse them in a process pool and merge them.
+
+        Returns a per-source report with download/parse timings so slow providers stand out.
+        """
+        report = {url: {'status': 'pending', 'download': 0.0, 'parse': 0.0, 'programmes': 0} for url in self.epg_urls}
+        loop = asyncio.get_running_loop()
+        cache = self.http_cache or get_cache()
+        # Guides are large: one source being stored must not evict another before a worker has read it.
+        merger = GuideMerger()
+
+        async def merge(parsing):
+            # Each guide is folded in as soon as its worker returns, then released
+            url, guide = await parsing
+            if guide is not None:
+                merger.add(self.source_priority.get(url, len(self.epg_urls)), guide)
+
+        with cache.pinned(cache.key(url) for url in self.epg_urls), ProcessPoolExecutor() as pool:
+            # Changed sources are parsed as soon as their download completes.
+            await asyncio.gather(*(merge(self._refresh_source(cache, pool, loop, url, report[url])) for url in self.epg_urls))
+            if not any(entry['status'] == 'ok' for entry in report.values()):
+                logging.info("Aucune source EPG modifiée, import ignoré")
+                return report
+            # Unchanged sources still take part in the merge from their cached copy.
+            await asyncio.gather(*(
+                merge(self._parse_source(cache, pool, loop, url, entry))
+                for url, entry in report.items() if entry['status'] == 'unchanged'
+            ))
+
+        count = self.store.import_guide(merger.result().items())
+        for url, entry in report.items():
+            if entry.get('validators') is not None:
+                self._save_validators(url, entry.pop('validators'))
+        for url, entry in sorted(report.items(), key=lambda item: -(item[1]['download'] + item[1]['parse'])):
+            logging.info(f"Source EPG {url}: {entry['status']}, téléchargement {entry['download']:.2f}s, analyse {entry['parse']:.2f}s, {entry['programmes']} programmes")
+        logging.info(f"{count} programmes importés depuis {merger.sources} sources EPG")
+        return report
+
+    async def _refresh_source(self, cache, pool, loop, url, entry, retry=True):
+        """Fetch one source through the HTTP cache, parsing it if it changed since the last import; returns (url, guide)."""
+        started = time.monotonic()
+        response = None
+        try:
+            response = await cache.fetch(url, background=False)
+            entry['path'] = response.path
+            validators = {name: header(response.headers, name) for name in ('ETag', 'Last-Modified')}
+            # A cached copy that never made it into the store (e.g. the last merge failed) still counts as changed
+            imported = json.loads(self.store.get_meta(f"validators:{url}", '{}'))
+            unchanged = response.source in ('hit', 'revalidated', 'stale') and imported == {
+                'etag': validators['ETag'], 'last_modified': validators['Last-Modified']}
+            entry['status'] = 'unchanged' if unchanged else 'ok'
+            if not unchanged:
+                entry['validators'] = validators
+        except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+            logging.error(f"Erreur lors du téléchargement du guide EPG depuis {url}: {e}")
+            entry['status'] = 'error'
+        entry['download'] = time.monotonic() - started
+        try:
+            if entry['status'] != 'ok':
+                return url, None
+            return await self._parse_source(cache, pool, loop, url, entry, retry)
+        finally:
+            if response is not None:
+                release(response)
+
+    async def _parse_source(self, cache, pool, loop, url, entry, retry=True):
+        cache_path = entry.get('path')
+        if cache_path is None:
+            return url, None
+        started = time.monotonic()
+        unreadable = None
+        try:
+            guide = await loop.run_in_executor(pool, parse_guide_file, cache_path)
+        except OSError as e:
+            unreadable = e
+        except (zipfile.BadZipFile, zlib.error, lzma.LZMAError, ET.ParseError, ValueError) as e:
+            logging.error(f"Erreur lors de l'analyse du guide EPG {url}: {e}")
+            entry['status'] = 'error'
+            entry.pop('validators', None)
+            cache.invalidate(url)
+            return url, None
+        finally:
+            entry['parse'] = time.monotonic() - started
+            EPG_PARSE_SECONDS.observe(entry['parse'], source=url)
+        if unreadable is not None:
+            # The cached body is gone (or unreadable): drop the entry and download the guide again, once
+            entry['status'] = 'error'
+            entry.pop('validators', None)
+            entry.pop('path', None)
+            cache.invalidate(url)
+            if not retry:
+                logging.error(f"Guide EPG {url} illisible: {unreadable}")
+                return url, None
+            logging.warning(f"Copie du guide EPG {url} illisible, nouveau téléchargement: {unreadable}")
+            return await self._refresh_source(cache, pool, loop, url, entry, retry=False)
+        entry['programmes'] = sum(len(programmes) for programmes in guide.values())
+        self._record_parse(url, entry['programmes'], entry['parse'])
+        return url, guide
@@ -0,0 +1,100 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from epg import Programme
+
+__version__ = "1.0.0"
+
+
+class ChannelTimeline:
+    """Programmes of one channel as parallel arrays sorted by start epoch."""
+
+    __slots__ = ('starts', 'stops', 'titles', 'descs', 'max_duration')
+
+    def __init__(self):
+        self.starts = array('q')
+        self.stops = array('q')
+        self.titles = array('l')
+        self.descs = array('l')
+        self.max_duration = 0
+
+
+class EpgGrid:
+    """Compact in-memory guide for grid rendering.
+
+    Each channel keeps its start/stop epochs in sorted arrays and refers to
+    titles and descriptions through interned string tables, so no Python
+    object is kept per programme. Lookups use binary search.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.strings = []
+        self._string_index = {}
+
+    @classmethod
+    def from_guide(cls, groups):
+        """Build a grid from (channel_id, [Programme, ...]) groups, e.g. iter_channel_programmes output."""
+        grid = cls()
+        for channel_id, programmes in groups:
+            grid.add_programmes(channel_id, programmes)
+        return grid
+
+    @classmethod
+    def from_store(cls, store, channel_ids, t0, t1):
+        return cls.from_guide(store.grid(channel_ids, t0, t1).items())
+
+    def _intern(self, text):
+        if text is None:
+            return -1
+        index = self._string_index.get(text)
+        if index is None:
+            index = self._string_index[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def add_programmes(self, channel_id, programmes):
+        timeline = self.channels.get(channel_id)
+        if timeline is None:
+            timeline = self.channels[channel_id] = ChannelTimeline()
+        rows = [(p[1], p[2], p[3], p[4]) for p in programmes if p[1] is not None and p[2] is not None]
+        if timeline.starts:
+            rows.extend(zip(timeline.starts, timeline.stops,
+                            (self._text(i) for i in timeline.titles), (self._text(i) for i in timeline.descs)))
+        rows.sort(key=lambda row: row[0])
+        timeline.starts = array('q', (row[0] for row in rows))
+        timeline.stops = array('q', (row[1] for row in rows))
+        timeline.titles = array('l', (self._intern(row[2]) for row in rows))
+        timeline.descs = array('l', (self._intern(row[3]) for row in rows))
+        timeline.max_duration = max((row[1] - row[0] for row in rows), default=0)
+
+    def _text(self, index):
+        return self.strings[index] if index >= 0 else None
+
+    def _programme(self, channel_id, timeline, index):
+        return Programme(channel_id, timeline.starts[index], timeline.stops[index],
+                         self._text(timeline.titles[index]), self._text(timeline.descs[index]))
+
+    def on_at(self, channel_id, at):
+        """Return the programme airing on channel_id at epoch `at`, or None."""
+        timeline = self.channels.get(channel_id)
+        if timeline is None:
+            return None
+        index = bisect_right(timeline.starts, at) - 1
+        while index >= 0 and timeline.starts[index] >= at - timeline.max_duration:
+            if timeline.stops[index] > at:
+                return self._programme(channel_id, timeline, index)
+            index -= 1
+        return None
+
+    def overlapping(self, channel_id, t0, t1):
+        """Return the programmes of channel_id overlapping [t0, t1), in start order."""
+        timeline = self.channels.get(channel_id)
+        if timeline is None:
+            return []
+        low = bisect_left(timeline.starts, t0 - timeline.max_duration)
+        high = bisect_left(timeline.starts, t1)
+        return [self._programme(channel_id, timeline, index)
+                for index in range(low, high) if timeline.stops[index] > t0]
+
+    def __len__(self):
+        return sum(len(timeline.starts) for timeline in self.channels.values())
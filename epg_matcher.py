@@ -0,0 +1,155 @@
+import logging
+import re
+from array import array
+from collections import Counter, namedtuple
+from epg import iter_channels, iter_file_chunks, open_xmltv_stream
+from utils import normalize_text
+
+__version__ = "1.0.0"
+
+# method: 'override', 'tvg-id', 'exact' or 'fuzzy'; score is 1.0 except for fuzzy matches
+ChannelMatch = namedtuple('ChannelMatch', ['channel_id', 'method', 'score'])
+
+# "FR| TF1", "FR: TF1", "[FR] TF1", "(UK) BBC One", "UK - BBC One"
+_COUNTRY_PREFIX = re.compile(r'^\s*(?:[A-Z]{2,4}\s*[|:]|[\[(][A-Z]{2,4}[\])]|[A-Z]{2}\s+-\s+)\s*')
+# Trailing country suffix of XMLTV ids, e.g. "TF1.fr" or "BBCOne.uk"
+_ID_SUFFIX = re.compile(r'\.[a-z]{2,3}$', re.IGNORECASE)
+QUALITY_TAGS = frozenset((
+    'sd', 'hd', 'fhd', 'uhd', 'hq', 'lq', '4k', '8k', '720p', '1080p', '1080i', '2160p', '720', '1080',
+    'hevc', 'h264', 'h265', 'x264', 'x265', '50fps', '60fps', 'raw', 'backup', 'multi', 'vip', 'direct', 'orig', 'live',
+))
+# Candidate keys gathered per fuzzy lookup, rarest trigrams first
+MAX_CANDIDATES = 500
+
+
+def channel_key(name):
+    """Normalised matching key: 'FR| TF1 FHD ᴿᴬᵂ' -> 'tf1'."""
+    text = _COUNTRY_PREFIX.sub('', name or '')
+    tokens = normalize_text(text).split()
+    kept = [token for token in tokens if token not in QUALITY_TAGS]
+    return ' '.join(kept or tokens)
+
+
+def id_key(channel_id):
+    """Matching key of an XMLTV id: 'TF1.fr' -> 'tf1'."""
+    return channel_key(_ID_SUFFIX.sub('', channel_id or ''))
+
+
+def _trigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class EpgMatcher:
+    """Links playlist channels to XMLTV guide channels through precomputed indexes.
+
+    Every guide channel is indexed once under the keys of its id and display
+    names: a case-folded id table for tvg-id, a dict for exact normalised
+    keys, and a trigram inverted index for fuzzy matches, scored by the Dice
+    coefficient of the trigram sets. A playlist name is resolved by, in
+    order, a manual override, its tvg-id, its exact key, then the best fuzzy
+    candidate scoring at least min_score. Results are memoised per key, since
+    playlists repeat a channel in several qualities.
+    """
+
+    def __init__(self, channels, overrides=None, store=None, min_score=0.6):
+        self.store = store
+        self.min_score = min_score
+        self.overrides = dict(overrides or {})
+        self.ids = {}
+        self.exact = {}
+        self.key_trigrams = []
+        self.key_channels = []
+        self.postings = {}
+        self._cache = {}
+        for channel_id, names in channels:
+            if not channel_id:
+                continue
+            self.ids.setdefault(channel_id.casefold(), channel_id)
+            for key in [id_key(channel_id)] + [channel_key(name) for name in names]:
+                if key and key not in self.exact:
+                    self._index_key(key, channel_id)
+
+    def _index_key(self, key, channel_id):
+        self.exact[key] = channel_id
+        position = len(self.key_trigrams)
+        trigrams = _trigrams(key)
+        self.key_trigrams.append(trigrams)
+        self.key_channels.append(channel_id)
+        for trigram in trigrams:
+            self.postings.setdefault(trigram, array('l')).append(position)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _fuzzy(self, key):
+        trigrams = _trigrams(key)
+        postings = sorted((self.postings[trigram] for trigram in trigrams if trigram in self.postings), key=len)
+        counts = Counter()
+        gathered = 0
+        for posting in postings:
+            # The rarest trigram is always used, so common words cannot hide every candidate
+            if gathered and gathered + len(posting) > MAX_CANDIDATES:
+                break
+            counts.update(posting)
+            gathered += len(posting)
+        best = None
+        for position, _ in counts.most_common(20):
+            candidate = self.key_trigrams[position]
+            score = 2 * len(trigrams & candidate) / (len(trigrams) + len(candidate))
+            if best is None or score > best[1]:
+                best = (position, score)
+        if best is None or best[1] < self.min_score:
+            return None
+        return ChannelMatch(self.key_channels[best[0]], 'fuzzy', round(best[1], 3))
+
+    def match(self, name, tvg_id=None):
+        """Return the ChannelMatch for a playlist entry, or None."""
+        key = channel_key(name)
+        if key in self.overrides:
+            return ChannelMatch(self.overrides[key], 'override', 1.0)
+        if tvg_id:
+            channel_id = self.ids.get(tvg_id.casefold())
+            if channel_id is not None:
+                return ChannelMatch(channel_id, 'tvg-id', 1.0)
+        if not key:
+            return None
+        if key not in self._cache:
+            channel_id = self.exact.get(key)
+            self._cache[key] = ChannelMatch(channel_id, 'exact', 1.0) if channel_id is not None else self._fuzzy(key)
+        return self._cache[key]
+
+    def match_all(self, entries):
+        """Map (name, tvg_id) pairs to ChannelMatch (or None), in order."""
+        return [self.match(name, tvg_id) for name, tvg_id in entries]
+
+    def set_override(self, name, channel_id):
+        """Force name to match channel_id (None removes the override); persisted when a store is attached."""
+        key = channel_key(name)
+        if channel_id is None:
+            self.overrides.pop(key, None)
+        else:
+            self.overrides[key] = channel_id
+        if self.store is not None:
+            self.store.set_channel_override(key, channel_id)
+
+
+def guide_channels(file_path):
+    """[(channel_id, [display name, ...])] declared in a (possibly compressed) XMLTV file."""
+    channels = []
+    for name, stream in open_xmltv_stream(iter_file_chunks(file_path), file_path):
+        channels.extend(iter_channels(stream))
+    return channels
+
+
+def build_matcher(store, guide_paths=(), min_score=0.6):
+    """Matcher over the channels declared in guide_paths plus every channel id in the store, with its overrides."""
+    channels = []
+    for path in guide_paths:
+        channels.extend(guide_channels(path))
+    known = {channel_id for channel_id, _ in channels}
+    # Guides without <channel> elements still contribute their ids
+    channels.extend((channel_id, ()) for channel_id in store.channel_ids() if channel_id not in known)
+    matcher = EpgMatcher(channels, store.channel_overrides(), store=store, min_score=min_score)
+    logging.info(f"Index de correspondance EPG: {len(matcher)} chaînes, {len(matcher.overrides)} corrections manuelles")
+    return matcher
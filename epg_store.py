@@ -0,0 +1,174 @@
+import logging
+import sqlite3
+import threading
+import time
+
+__version__ = "1.0.0"
+
+RETENTION = 24 * 3600  # keep programmes that ended less than a day ago
+BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS programmes (
+    channel_id TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    title TEXT,
+    title_key TEXT,
+    desc TEXT,
+    PRIMARY KEY (channel_id, start)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_programmes_start ON programmes (start, title_key);
+CREATE TABLE IF NOT EXISTS channel_overrides (
+    name_key TEXT PRIMARY KEY,
+    channel_id TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT = """
+INSERT INTO programmes (channel_id, start, stop, title, title_key, desc)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (channel_id, start) DO UPDATE SET
+    stop = excluded.stop, title = excluded.title, title_key = excluded.title_key, desc = excluded.desc
+WHERE stop IS NOT excluded.stop OR title IS NOT excluded.title OR desc IS NOT excluded.desc
+"""
+
+COLUMNS = "channel_id, start, stop, title, desc"
+
+
+class EpgStore:
+    """Persistent EPG keyed by (channel_id, start epoch), backed by SQLite in WAL mode."""
+
+    def __init__(self, db_path='epg.db'):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def import_guide(self, groups, retention=RETENTION):
+        """Import (channel_id, [Programme, ...]) groups incrementally.
+
+        Unchanged programmes are left untouched, changed ones are replaced and
+        programmes that disappeared from a channel's imported time window are
+        removed. Programmes older than the retention window are pruned.
+        Returns the number of programmes received.
+        """
+        received = upserted = 0
+        windows = {}
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (channel_id TEXT, start INTEGER, PRIMARY KEY (channel_id, start)) WITHOUT ROWID")
+            self.conn.execute("DELETE FROM incoming")
+            batch = []
+            for channel_id, programmes in groups:
+                for p in programmes:
+                    if p.start is None or p.stop is None:
+                        continue
+                    batch.append((channel_id, p.start, p.stop, p.title, (p.title or '').lower(), p.desc))
+                    low, high = windows.get(channel_id, (p.start, p.start))
+                    windows[channel_id] = (min(low, p.start), max(high, p.start))
+                if len(batch) >= BATCH_SIZE:
+                    upserted += self._write_batch(batch)
+                    received += len(batch)
+                    batch = []
+            upserted += self._write_batch(batch)
+            received += len(batch)
+            removed = 0
+            for channel_id, (low, high) in windows.items():
+                removed += self.conn.execute(
+                    "DELETE FROM programmes WHERE channel_id = ? AND start BETWEEN ? AND ? "
+                    "AND NOT EXISTS (SELECT 1 FROM incoming i WHERE i.channel_id = programmes.channel_id AND i.start = programmes.start)",
+                    (channel_id, low, high),
+                ).rowcount
+            self.conn.execute("DELETE FROM incoming")
+            pruned = self.conn.execute("DELETE FROM programmes WHERE stop < ?", (int(time.time()) - retention,)).rowcount
+        logging.info(f"EPG import: {received} programmes reçus, {upserted} ajoutés/modifiés, {removed} supprimés, {pruned} expirés")
+        return received
+
+    def _write_batch(self, batch):
+        if not batch:
+            return 0
+        self.conn.executemany("INSERT OR IGNORE INTO incoming (channel_id, start) VALUES (?, ?)", [row[:2] for row in batch])
+        changes_before = self.conn.total_changes
+        self.conn.executemany(UPSERT, batch)
+        return self.conn.total_changes - changes_before
+
+    def prune(self, retention=RETENTION):
+        with self.lock, self.conn:
+            return self.conn.execute("DELETE FROM programmes WHERE stop < ?", (int(time.time()) - retention,)).rowcount
+
+    def now_next(self, channel_id, at=None):
+        """Return (current, next) programme rows for a channel; either may be None."""
+        at = int(time.time()) if at is None else at
+        with self.lock:
+            current = self.conn.execute(
+                f"SELECT {COLUMNS} FROM programmes WHERE channel_id = ? AND start <= ? ORDER BY start DESC LIMIT 1",
+                (channel_id, at),
+            ).fetchone()
+            following = self.conn.execute(
+                f"SELECT {COLUMNS} FROM programmes WHERE channel_id = ? AND start > ? ORDER BY start LIMIT 1",
+                (channel_id, at),
+            ).fetchone()
+        if current and current[2] <= at:
+            current = None
+        return current, following
+
+    def grid(self, channel_ids, t0, t1):
+        """Return {channel_id: [rows overlapping [t0, t1)]} for the given channels."""
+        result = {channel_id: [] for channel_id in channel_ids}
+        with self.lock:
+            for channel_id in result:
+                result[channel_id] = self.conn.execute(
+                    f"SELECT {COLUMNS} FROM programmes WHERE channel_id = ? AND start < ? AND stop > ? ORDER BY start",
+                    (channel_id, t1, t0),
+                ).fetchall()
+        return result
+
+    def search_titles(self, query, t0=None, t1=None, limit=100):
+        """Case-insensitive title search over programmes starting in [t0, t1) (default: next 24h)."""
+        t0 = int(time.time()) if t0 is None else t0
+        t1 = t0 + 24 * 3600 if t1 is None else t1
+        with self.lock:
+            # Match on the covering (start, title_key) index first, then fetch only the hits.
+            keys = self.conn.execute(
+                "SELECT channel_id, start FROM programmes WHERE start >= ? AND start < ? AND instr(title_key, ?) > 0 ORDER BY start LIMIT ?",
+                (t0, t1, query.lower(), limit),
+            ).fetchall()
+            return [
+                self.conn.execute(f"SELECT {COLUMNS} FROM programmes WHERE channel_id = ? AND start = ?", key).fetchone()
+                for key in keys
+            ]
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def channel_ids(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT channel_id FROM programmes")]
+
+    def channel_overrides(self):
+        """{normalised playlist name: guide channel id} fixed by hand."""
+        with self.lock:
+            return dict(self.conn.execute("SELECT name_key, channel_id FROM channel_overrides"))
+
+    def set_channel_override(self, name_key, channel_id):
+        with self.lock, self.conn:
+            if channel_id is None:
+                self.conn.execute("DELETE FROM channel_overrides WHERE name_key = ?", (name_key,))
+            else:
+                self.conn.execute("INSERT OR REPLACE INTO channel_overrides (name_key, channel_id) VALUES (?, ?)", (name_key, channel_id))
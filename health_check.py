@@ -0,0 +1,219 @@
+import asyncio
+import contextlib
+import logging
+import math
+import random
+import time
+from array import array
+from collections import namedtuple
+from urllib.parse import urlparse
+import metrics
+from startup import lazy_import
+
+aiohttp = lazy_import('aiohttp')
+
+__version__ = "1.0.0"
+
+RETRIES = metrics.counter('checkerip_retries_total', "Retried network operations", ('operation', 'host'))
+TIMEOUTS = metrics.counter('checkerip_timeouts_total', "Network operations that timed out", ('operation', 'host'))
+CHECK_SECONDS = metrics.histogram('checkerip_health_check_seconds', "Successful health check latency per host", ('host',))
+
+HealthCheck = namedtuple('HealthCheck', ['url', 'mac', 'probe'])
+CheckResult = namedtuple('CheckResult', ['url', 'mac', 'ok', 'latency', 'attempts', 'error'])
+
+
+class HealthHistory:
+    """Fixed-size ring buffer of recent check results for one subscription.
+
+    Timestamps, latencies (NaN when the check failed) and statuses live in
+    three typed arrays, so a few hundred subscriptions cost a few KB.
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.checked_at = array('d', [0.0] * capacity)
+        self.latency = array('d', [0.0] * capacity)
+        self.ok = array('b', [0] * capacity)
+        self.start = 0
+        self.count = 0
+
+    def append(self, checked_at, ok, latency=None):
+        index = (self.start + self.count) % self.capacity
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.count += 1
+        self.checked_at[index] = checked_at
+        self.latency[index] = math.nan if latency is None else latency
+        self.ok[index] = 1 if ok else 0
+
+    def __len__(self):
+        return self.count
+
+    def _indexes(self, last=None):
+        count = self.count if last is None else min(last, self.count)
+        return [(self.start + i) % self.capacity for i in range(self.count - count, self.count)]
+
+    def entries(self, last=None):
+        """[(checked_at, ok, latency)] oldest first."""
+        return [(self.checked_at[i], bool(self.ok[i]), None if math.isnan(self.latency[i]) else self.latency[i])
+                for i in self._indexes(last)]
+
+    def last_checked(self):
+        return self.checked_at[self._indexes(1)[0]] if self.count else None
+
+    def streak(self):
+        """(ok, length) of the run of identical results ending with the latest check."""
+        indexes = self._indexes()
+        if not indexes:
+            return None, 0
+        latest = self.ok[indexes[-1]]
+        length = 0
+        for i in reversed(indexes):
+            if self.ok[i] != latest:
+                break
+            length += 1
+        return bool(latest), length
+
+    def uptime(self, last=None):
+        indexes = self._indexes(last)
+        return sum(self.ok[i] for i in indexes) / len(indexes) if indexes else None
+
+    def latency_percentiles(self, fractions=(0.5, 0.95, 0.99)):
+        latencies = sorted(self.latency[i] for i in self._indexes() if not math.isnan(self.latency[i]))
+        if not latencies:
+            return {fraction: None for fraction in fractions}
+        return {fraction: latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] for fraction in fractions}
+
+
+class AdaptiveInterval:
+    """Decides when a subscription is next due for a check, from its history.
+
+    Until the same result has held for `window` consecutive checks (new,
+    flaky or just-changed subscriptions) the interval is min_interval; each
+    further identical result doubles it up to max_interval, so a long-stable
+    subscription, up or down, is only checked a few times a day.
+    """
+
+    def __init__(self, min_interval=60.0, max_interval=6 * 3600.0, window=8):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window = window
+
+    def interval(self, history):
+        _, streak = history.streak()
+        if streak < self.window:
+            # New, flaky or just changed: the result has not held for a full window yet
+            return self.min_interval
+        return min(self.max_interval, self.min_interval * 2 ** (streak - self.window + 1))
+
+    def next_due(self, history):
+        last = history.last_checked()
+        return 0.0 if last is None else last + self.interval(history)
+
+    def is_due(self, history, now=None):
+        return self.next_due(history) <= (time.time() if now is None else now)
+
+
+class CheckScheduler:
+    """Runs connectivity probes under a global concurrency cap and per-host limits.
+
+    Each host gets its own concurrency cap and a minimum interval between
+    requests, so one provider never receives every check at once. Failed
+    probes are retried with jittered exponential backoff until the per-check
+    deadline, and results are yielded as soon as each check completes.
+    """
+
+    def __init__(self, max_concurrency=20, per_host=2, host_interval=0.2, retries=3,
+                 base_delay=1.0, max_delay=20.0, deadline=45.0):
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.host_interval = host_interval
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._global_limit = None
+        self._host_limits = {}
+        self._host_locks = {}
+        self._host_next_slot = {}
+        self._tasks = set()
+
+    def _host_limit(self, host):
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+            self._host_locks[host] = asyncio.Lock()
+        return self._host_limits[host]
+
+    async def _wait_for_host_slot(self, host):
+        loop = asyncio.get_running_loop()
+        async with self._host_locks[host]:
+            now = loop.time()
+            slot = max(now, self._host_next_slot.get(host, now))
+            self._host_next_slot[host] = slot + self.host_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    @contextlib.asynccontextmanager
+    async def limit(self, url):
+        """Hold a global and a per-host slot for one request to url, paced like the health checks."""
+        if self._global_limit is None:
+            self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        host = urlparse(url).netloc
+        async with self._global_limit, self._host_limit(host):
+            await self._wait_for_host_slot(host)
+            yield
+
+    async def _run_check(self, check):
+        loop = asyncio.get_running_loop()
+        host = urlparse(check.url).netloc
+        # The deadline only counts time spent probing and backing off: waiting in the queue
+        # behind other checks on the same host is not the portal's fault.
+        spent = 0.0
+        error = None
+        attempt = 0
+        while attempt < self.retries:
+            attempt += 1
+            if spent >= self.deadline:
+                error = error or 'deadline exceeded'
+                break
+            sent = None
+            try:
+                async with self.limit(check.url):
+                    sent = loop.time()
+                    ok = await asyncio.wait_for(check.probe(), timeout=self.deadline - spent)
+                    CHECK_SECONDS.observe(loop.time() - sent, host=host)
+                    return CheckResult(check.url, check.mac, ok, loop.time() - sent, attempt, None)
+            except asyncio.TimeoutError:
+                error = 'timeout'
+                TIMEOUTS.inc(operation='health_check', host=host)
+            except (aiohttp.ClientError, OSError) as e:
+                error = str(e) or type(e).__name__
+            if sent is not None:
+                spent += loop.time() - sent
+            # Full jitter keeps retries against the same host from lining up.
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+            if attempt < self.retries and spent < self.deadline:
+                RETRIES.inc(operation='health_check', host=host)
+                delay = min(delay, self.deadline - spent)
+                await asyncio.sleep(delay)
+                spent += delay
+        logging.warning(f"Échec de la vérification de {check.url} (MAC {check.mac}) après {attempt} tentative(s): {error}")
+        return CheckResult(check.url, check.mac, False, None, attempt, error)
+
+    async def run(self, checks):
+        """Yield a CheckResult for each HealthCheck as soon as it completes."""
+        tasks = [asyncio.ensure_future(self._run_check(check)) for check in checks]
+        self._tasks.update(tasks)
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._tasks.difference_update(tasks)
+
+    def shutdown(self):
+        """Cancel every check still in flight (safe to call from the scheduler's loop only)."""
+        for task in list(self._tasks):
+            task.cancel()
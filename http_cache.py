@@ -0,0 +1,373 @@
+import asyncio
+import contextlib
+import email.utils
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from http_client import get_client
+import metrics
+from startup import lazy_import
+
+aiohttp = lazy_import('aiohttp')
+
+__version__ = "1.0.0"
+
+CHUNK_SIZE = 64 * 1024
+# Temporary bodies older than this were left behind by a crashed process
+TEMP_MAX_AGE = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    last_access REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access);
+"""
+
+# source: 'network' (fetched), 'hit' (fresh copy), 'revalidated' (304), 'stale' (served while refreshing),
+# 'uncached' (no-store body in a temporary file, deleted by release())
+CachedResponse = namedtuple('CachedResponse', ['url', 'status', 'headers', 'path', 'source'])
+
+CACHE_REQUESTS = metrics.counter('checkerip_http_cache_requests_total', "HTTP cache lookups by outcome", ('result',))
+CACHE_SAVED_BYTES = metrics.counter('checkerip_http_cache_saved_bytes_total', "Response bytes served from the cache instead of the network")
+
+
+def read_body(response):
+    with open(response.path, 'rb') as f:
+        return f.read()
+
+
+def read_json(response):
+    with open(response.path, 'rb') as f:
+        return json.load(f)
+
+
+def release(response):
+    """Delete the temporary body of an 'uncached' response once it has been read; other bodies belong to the cache."""
+    if response.source == 'uncached':
+        try:
+            os.remove(response.path)
+        except FileNotFoundError:
+            pass
+
+
+def header(headers, name):
+    """Case-insensitive lookup in a stored header dict."""
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name), None)
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+class HttpCache:
+    """Disk-backed HTTP response cache shared by the network code.
+
+    Entries are keyed by URL plus the request headers named in vary, and
+    bodies are stored as files so large guides are never held in memory.
+    Freshness comes from a per-resource TTL override (fnmatch pattern on the
+    URL), else Cache-Control max-age / Expires; expired entries are
+    revalidated with If-None-Match / If-Modified-Since. Within the
+    stale-while-revalidate window an expired entry is returned at once while
+    a background task refreshes it; responses marked no-cache or
+    must-revalidate get no such window. The total body size is bounded by
+    evicting least recently used entries, except those pinned by a
+    running operation. no-store bodies are never
+    indexed: they go to a temporary file that the caller releases.
+    """
+
+    def __init__(self, directory='.http_cache', max_bytes=512 * 1024 * 1024, ttl_overrides=None,
+                 stale_while_revalidate=24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_overrides = dict(ttl_overrides or {})
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'revalidated': 0, 'bytes_saved': 0, 'evictions': 0}
+        self.lock = threading.Lock()
+        self.temp_directory = os.path.join(directory, 'tmp')
+        os.makedirs(self.temp_directory, exist_ok=True)
+        self._clean_temp()
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._refreshing = {}
+        self._pins = Counter()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def update_settings(self, max_bytes=512 * 1024 * 1024, ttl_overrides=None, stale_while_revalidate=24 * 3600):
+        """Apply new limits to a live cache; a smaller max_bytes evicts at once."""
+        self.max_bytes = max_bytes
+        self.ttl_overrides = dict(ttl_overrides or {})
+        self.stale_while_revalidate = stale_while_revalidate
+        self._evict()
+
+    def _clean_temp(self):
+        expired = time.time() - TEMP_MAX_AGE
+        for entry in os.scandir(self.temp_directory):
+            try:
+                if entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def key(self, url, headers=None, vary=()):
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        varied = '\n'.join(f"{name.lower()}: {headers.get(name.lower(), '')}" for name in sorted(vary))
+        return hashlib.sha1(f"{url}\n{varied}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.body')
+
+    def _count(self, result, saved=0):
+        self.stats[result] += 1
+        CACHE_REQUESTS.inc(result=result)
+        if saved:
+            self.stats['bytes_saved'] += saved
+            CACHE_SAVED_BYTES.inc(saved)
+
+    def _lookup(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT url, status, headers, size, expires_at, stale_until FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or not os.path.exists(self._path(key)):
+            return None
+        return row
+
+    def _touch(self, key, expires_at=None, stale_until=None):
+        with self.lock, self.conn:
+            if expires_at is None:
+                self.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            else:
+                self.conn.execute(
+                    "UPDATE entries SET last_access = ?, expires_at = ?, stale_until = ? WHERE key = ?",
+                    (time.time(), expires_at, stale_until, key),
+                )
+
+    def _freshness(self, url, headers, ttl):
+        """Return (expires_at, stale_until), or None when the response must not be stored."""
+        now = time.time()
+        control = parse_cache_control(header(headers, 'Cache-Control'))
+        if 'no-store' in control:
+            return None
+        if ttl is None:
+            ttl = next((seconds for pattern, seconds in self.ttl_overrides.items() if fnmatch.fnmatch(url, pattern)), None)
+        if ttl is None:
+            if 'no-cache' in control:
+                ttl = 0
+            elif control.get('max-age', '').isdigit():
+                ttl = int(control['max-age']) - int(header(headers, 'Age') or 0)
+            elif header(headers, 'Expires'):
+                parsed = email.utils.parsedate_tz(header(headers, 'Expires'))
+                ttl = email.utils.mktime_tz(parsed) - now if parsed else 0
+            else:
+                ttl = 0  # validators only: revalidate on every use
+        if 'no-cache' in control or 'must-revalidate' in control:
+            stale = 0  # the origin asked for revalidation before any reuse
+        else:
+            stale = control.get('stale-while-revalidate')
+            stale = int(stale) if stale and stale.isdigit() else self.stale_while_revalidate
+        expires_at = now + max(0, ttl)
+        return expires_at, expires_at + stale
+
+    def _conditional_headers(self, stored_headers):
+        headers = {}
+        if header(stored_headers, 'ETag'):
+            headers['If-None-Match'] = header(stored_headers, 'ETag')
+        if header(stored_headers, 'Last-Modified'):
+            headers['If-Modified-Since'] = header(stored_headers, 'Last-Modified')
+        return headers
+
+    async def fetch(self, url, headers=None, vary=(), ttl=None, background=True):
+        """GET url through the cache and return a CachedResponse whose body is at .path.
+
+        With background=False an expired entry is always revalidated before
+        returning, e.g. when the caller explicitly asked for a refresh.
+        Network errors propagate unless an expired copy can be served instead
+        (never for a must-revalidate response).
+        """
+        key = self.key(url, headers, vary)
+        row = self._lookup(key)
+        if row is not None:
+            stored_url, status, stored_headers, size, expires_at, stale_until = row
+            stored_headers = json.loads(stored_headers)
+            now = time.time()
+            if now < expires_at:
+                self._touch(key)
+                self._count('hits', size)
+                return CachedResponse(url, status, stored_headers, self._path(key), 'hit')
+            if background and now < stale_until:
+                self._touch(key)
+                self._count('stale', size)
+                if key not in self._refreshing:
+                    task = asyncio.ensure_future(self._refresh_in_background(key, url, headers, ttl, stored_headers))
+                    self._refreshing[key] = task
+                    task.add_done_callback(lambda task: self._refreshing.pop(key, None))
+                return CachedResponse(url, status, stored_headers, self._path(key), 'stale')
+            try:
+                return await self._revalidate(key, url, headers, ttl, stored_headers)
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+                if 'must-revalidate' in parse_cache_control(header(stored_headers, 'Cache-Control')):
+                    raise
+                # An old copy beats no data
+                logging.warning(f"Revalidation impossible de {url}, copie en cache utilisée: {e}")
+                self._count('stale', size)
+                return CachedResponse(url, status, stored_headers, self._path(key), 'stale')
+        self._count('misses')
+        return await self._download(key, url, headers, ttl)
+
+    async def _revalidate(self, key, url, headers, ttl, stored_headers):
+        request_headers = dict(headers or {})
+        request_headers.update(self._conditional_headers(stored_headers))
+        return await self._download(key, url, request_headers, ttl, stored_headers)
+
+    async def _refresh_in_background(self, key, url, headers, ttl, stored_headers):
+        try:
+            await self._revalidate(key, url, headers, ttl, stored_headers)
+        except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+            logging.warning(f"Rafraîchissement en arrière-plan de {url} échoué: {e}")
+
+    async def _download(self, key, url, headers, ttl, stored_headers=None):
+        session = await get_client().session()
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and stored_headers is not None:
+                merged = dict(stored_headers)
+                merged.update({name: value for name, value in response.headers.items()
+                               if name.lower() in ('cache-control', 'expires', 'etag', 'last-modified', 'age')})
+                freshness = self._freshness(url, merged, ttl) or (time.time(), time.time())
+                self._touch(key, *freshness)
+                self._count('revalidated', os.path.getsize(self._path(key)))
+                return CachedResponse(url, 200, stored_headers, self._path(key), 'revalidated')
+            response.raise_for_status()
+            response_headers = {name: value for name, value in response.headers.items()}
+            size = 0
+            fd, temp_path = tempfile.mkstemp(suffix='.body', dir=self.temp_directory)
+            try:
+                with open(fd, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        freshness = self._freshness(url, response_headers, ttl) if response.status == 200 else None
+        if freshness is None:
+            # no-store (or not a 200): the caller reads the temporary body once, then releases it
+            self._remove(key)
+            return CachedResponse(url, response.status, response_headers, temp_path, 'uncached')
+        os.replace(temp_path, self._path(key))
+        self._store(key, url, response.status, response_headers, size, *freshness)
+        return CachedResponse(url, response.status, response_headers, self._path(key), 'network')
+
+    def _store(self, key, url, status, headers, size, expires_at, stale_until):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, url, status, headers, size, stored_at, expires_at, stale_until, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(headers), size, now, expires_at, stale_until, now),
+            )
+        self._evict(keep=key)
+
+    @contextlib.contextmanager
+    def pinned(self, keys):
+        """Keep the entries for keys out of eviction while the block runs, e.g. while worker processes read their bodies."""
+        keys = list(keys)
+        with self.lock:
+            self._pins.update(keys)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self._pins.subtract(keys)
+                self._pins = +self._pins
+
+    def _evict(self, keep=None):
+        """Drop least recently used entries until the bodies fit in max_bytes; pinned entries are skipped."""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                if total <= self.max_bytes:
+                    break
+                if key != keep and key not in self._pins:
+                    victims.append(key)
+                    total -= size
+        for key in victims:
+            self._remove(key)
+            self.stats['evictions'] += 1
+
+    def _remove(self, key):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def invalidate(self, url, headers=None, vary=()):
+        """Forget a cached response, e.g. after its body turned out to be unusable."""
+        self._remove(self.key(url, headers, vary))
+
+    def size(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries").fetchone()
+
+    def cache_stats(self):
+        stats = dict(self.stats)
+        stats['stored_bytes'], stats['entries'] = self.size()
+        lookups = stats['hits'] + stats['stale'] + stats['revalidated'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['stale'] + stats['revalidated']) / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache()
+        return _cache
+
+
+def configure(directory='.http_cache', **options):
+    """Apply options (see HttpCache) to the shared cache, in place unless the directory changes.
+
+    A cache for another directory replaces the shared one without closing it:
+    fetches still running on the old cache finish normally, and its SQLite
+    connection is closed once it is no longer referenced.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is not None and os.path.abspath(_cache.directory) == os.path.abspath(directory):
+            _cache.update_settings(**options)
+        else:
+            _cache = HttpCache(directory, **options)
+        return _cache
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import threading
+import weakref
+from urllib.parse import urlparse
+import metrics
+from startup import lazy_import
+
+# Both HTTP stacks are imported on first request rather than at startup
+aiohttp = lazy_import('aiohttp')
+requests = lazy_import('requests')
+
+__version__ = "1.0.0"
+
+HTTP_SECONDS = metrics.histogram('checkerip_http_request_seconds', "Time until response headers, per host", ('host',))
+HTTP_RESPONSES = metrics.counter('checkerip_http_responses_total', "HTTP responses per host and status", ('host', 'status'))
+HTTP_ERRORS = metrics.counter('checkerip_http_errors_total', "Failed HTTP requests per host and error type", ('host', 'error'))
+HTTP_BYTES = metrics.counter('checkerip_http_received_bytes_total', "Response body bytes received per host", ('host',))
+
+
+class HttpClient:
+    """Process-wide pooled HTTP client shared by the network code.
+
+    One long-lived aiohttp session is kept per event loop, with keep-alive,
+    per-host connection limits and DNS caching, plus one requests.Session for
+    the synchronous download paths. Connection reuse is counted through
+    aiohttp trace hooks.
+    """
+
+    def __init__(self, limit=100, limit_per_host=8, dns_cache_ttl=300, keepalive_timeout=30,
+                 connect_timeout=10, read_timeout=60, user_agent='Mozilla/5.0'):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.user_agent = user_agent
+        self.stats = {
+            'requests': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'dns_cache_hits': 0,
+            'dns_cache_misses': 0,
+        }
+        self._sessions = weakref.WeakKeyDictionary()
+        self._sync_session = None
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+
+    def _count(self, name):
+        async def handler(session, context, params):
+            self.stats[name] += 1
+        return handler
+
+    async def _request_start(self, session, context, params):
+        self.stats['requests'] += 1
+        context.started = asyncio.get_running_loop().time()
+
+    async def _request_end(self, session, context, params):
+        host = params.url.host
+        HTTP_SECONDS.observe(asyncio.get_running_loop().time() - context.started, host=host)
+        HTTP_RESPONSES.inc(host=host, status=params.response.status)
+
+    async def _request_exception(self, session, context, params):
+        HTTP_ERRORS.inc(host=params.url.host, error=type(params.exception).__name__)
+
+    async def _chunk_received(self, session, context, params):
+        HTTP_BYTES.inc(len(params.chunk), host=params.url.host)
+
+    def _trace_config(self):
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._request_start)
+        trace.on_request_end.append(self._request_end)
+        trace.on_request_exception.append(self._request_exception)
+        trace.on_response_chunk_received.append(self._chunk_received)
+        trace.on_connection_create_end.append(self._count('connections_created'))
+        trace.on_connection_reuseconn.append(self._count('connections_reused'))
+        trace.on_dns_cache_hit.append(self._count('dns_cache_hits'))
+        trace.on_dns_cache_miss.append(self._count('dns_cache_misses'))
+        return trace
+
+    async def session(self):
+        """Return the shared aiohttp session for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={'User-Agent': self.user_agent},
+                trace_configs=[self._trace_config()],
+            )
+            self._sessions[loop] = session
+        return session
+
+    def sync_session(self):
+        """Return the shared requests.Session used by blocking downloads."""
+        with self._lock:
+            if self._sync_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.limit, pool_maxsize=self.limit_per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = self.user_agent
+                session.hooks['response'].append(self._sync_response)
+                self._sync_session = session
+            return self._sync_session
+
+    def _sync_response(self, response, *args, **kwargs):
+        host = urlparse(response.url).hostname
+        HTTP_SECONDS.observe(response.elapsed.total_seconds(), host=host)
+        HTTP_RESPONSES.inc(host=host, status=response.status_code)
+        # Streamed bodies are not read yet; the declared length is the best available count
+        HTTP_BYTES.inc(int(response.headers.get('Content-Length') or 0), host=host)
+
+    @property
+    def sync_timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def connection_stats(self):
+        stats = dict(self.stats)
+        opened = stats['connections_created'] + stats['connections_reused']
+        stats['reuse_ratio'] = stats['connections_reused'] / opened if opened else 0.0
+        return stats
+
+    async def close(self):
+        """Close the session bound to the running loop (call before the loop shuts down)."""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def close_sync(self):
+        with self._lock:
+            if self._sync_session is not None:
+                self._sync_session.close()
+                self._sync_session = None
+
+    def close_all(self):
+        """Close every per-loop session on its own loop, plus the requests.Session, from any thread.
+
+        Used when the client is replaced: requests still running on the old
+        sessions fail with a ClientError, which callers already handle.
+        """
+        for loop, session in list(self._sessions.items()):
+            if not session.closed and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+        self._sessions.clear()
+        self.close_sync()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def configure(**options):
+    """Replace the shared client with one built from options (see HttpClient)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close_all()
+        _client = HttpClient(**options)
+        logging.info(f"Client HTTP configuré: {options}")
+        return _client
@@ -0,0 +1,200 @@
+from tkinter import Listbox, Scrollbar
+
+__version__ = "1.0.0"
+
+
+class ListModel:
+    """Ordered records keyed by a stable key, with a precomputed lowercase filter key.
+
+    set_records() diffs the new records against the current ones and reports
+    which keys were added, removed or changed, so views only touch those rows.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.visible = []
+        self.query = ''
+
+    def set_records(self, records):
+        """Replace the content with (key, text, payload) triples; returns (added, removed, changed) keys."""
+        previous = self.records
+        self.records = {}
+        added, changed = [], []
+        for key, text, payload in records:
+            old = previous.get(key)
+            if old is None:
+                added.append(key)
+            elif old[0] != text:
+                changed.append(key)
+            self.records[key] = (text, text.casefold(), payload)
+        removed = [key for key in previous if key not in self.records]
+        self._refilter(self.query, narrowing=False)
+        return added, removed, changed
+
+    def append_records(self, records):
+        """Add (key, text, payload) triples after the current ones; only the new rows are filtered."""
+        added = []
+        for key, text, payload in records:
+            if key not in self.records:
+                added.append(key)
+            self.records[key] = (text, text.casefold(), payload)
+        if self.query:
+            self.visible.extend(key for key in added if self.query in self.records[key][1])
+        else:
+            self.visible.extend(added)
+        return added
+
+    def set_filter(self, query):
+        query = query.casefold().strip()
+        # Typing more characters only narrows the current result, so rescan just that.
+        self._refilter(query, narrowing=bool(self.query) and query.startswith(self.query))
+
+    def _refilter(self, query, narrowing):
+        keys = self.visible if narrowing else self.records
+        self.query = query
+        if query:
+            self.visible = [key for key in keys if query in self.records[key][1]]
+        else:
+            self.visible = list(self.records)
+
+    def text(self, key):
+        return self.records[key][0]
+
+    def payload(self, key):
+        record = self.records.get(key)
+        return record[2] if record else None
+
+    def __len__(self):
+        return len(self.visible)
+
+
+class VirtualListView:
+    """Listbox that only holds the rows currently on screen.
+
+    The scrollbar is driven from the model size rather than the widget content,
+    and a re-render only rewrites rows whose text differs from what is shown.
+    Selection follows the record key, so it survives updates and filtering.
+    """
+
+    def __init__(self, master, model=None, rows=20, width=50, on_select=None):
+        self.model = model or ListModel()
+        self.rows = rows
+        self.top = 0
+        self.selected_key = None
+        self.on_select = on_select
+        self._rendered = []
+        self.listbox = Listbox(master, width=width, height=rows, exportselection=False)
+        self.scrollbar = Scrollbar(master, orient='vertical', command=self._on_scrollbar)
+        self.listbox.bind('<<ListboxSelect>>', self._on_listbox_select)
+        self.listbox.bind('<MouseWheel>', lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.listbox.bind('<Button-4>', lambda event: self.scroll(-1))
+        self.listbox.bind('<Button-5>', lambda event: self.scroll(1))
+        self.listbox.bind('<Up>', lambda event: self._move_selection(-1))
+        self.listbox.bind('<Down>', lambda event: self._move_selection(1))
+        self.listbox.bind('<Prior>', lambda event: self.scroll(-self.rows))
+        self.listbox.bind('<Next>', lambda event: self.scroll(self.rows))
+
+    def grid(self, row, column, rowspan=1, padx=5, pady=5):
+        self.listbox.grid(row=row, column=column, rowspan=rowspan, padx=padx, pady=pady)
+        self.scrollbar.grid(row=row, column=column + 1, rowspan=rowspan, sticky='ns')
+
+    def set_records(self, records):
+        changes = self.model.set_records(records)
+        self.render()
+        return changes
+
+    def append_records(self, records):
+        added = self.model.append_records(records)
+        self.render()
+        return added
+
+    def set_filter(self, query):
+        self.model.set_filter(query)
+        self.top = 0
+        self.render()
+
+    def selected(self):
+        """Return the payload of the selected record, or None."""
+        return self.model.payload(self.selected_key)
+
+    def neighbours(self, count):
+        """Payloads of up to count visible records around the selection, nearest first, next before previous."""
+        visible = self.model.visible
+        try:
+            index = visible.index(self.selected_key)
+        except ValueError:
+            return []
+        keys = []
+        for distance in range(1, len(visible)):
+            keys.extend(visible[i] for i in (index + distance, index - distance) if 0 <= i < len(visible))
+            if len(keys) >= count:
+                break
+        return [self.model.payload(key) for key in keys[:count]]
+
+    def scroll(self, delta):
+        self.scroll_to(self.top + delta)
+        return 'break'
+
+    def scroll_to(self, top):
+        self.top = max(0, min(top, len(self.model) - self.rows))
+        self.render()
+
+    def render(self):
+        visible = self.model.visible
+        self.top = max(0, min(self.top, len(visible) - self.rows))
+        keys = visible[self.top:self.top + self.rows]
+        texts = [self.model.text(key) for key in keys]
+        for index, text in enumerate(texts):
+            if index >= len(self._rendered):
+                self.listbox.insert('end', text)
+            elif self._rendered[index] != text:
+                self.listbox.delete(index)
+                self.listbox.insert(index, text)
+        if len(self._rendered) > len(texts):
+            self.listbox.delete(len(texts), 'end')
+        self._rendered = texts
+
+        self.listbox.selection_clear(0, 'end')
+        if self.selected_key in keys:
+            self.listbox.selection_set(keys.index(self.selected_key))
+        total = len(visible)
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + len(keys)) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _on_scrollbar(self, action, *args):
+        if action == 'moveto':
+            self.scroll_to(int(float(args[0]) * len(self.model)))
+        elif action == 'scroll':
+            amount = int(args[0]) * (self.rows if args[1] == 'pages' else 1)
+            self.scroll_to(self.top + amount)
+
+    def _on_listbox_select(self, event):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        index = self.top + selection[0]
+        if index < len(self.model.visible):
+            self.selected_key = self.model.visible[index]
+            if self.on_select is not None:
+                self.on_select(self.selected())
+
+    def _move_selection(self, delta):
+        visible = self.model.visible
+        if not visible:
+            return 'break'
+        try:
+            index = visible.index(self.selected_key) + delta
+        except ValueError:
+            index = self.top
+        index = max(0, min(index, len(visible) - 1))
+        self.selected_key = visible[index]
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self.rows:
+            self.top = index - self.rows + 1
+        self.render()
+        if self.on_select is not None:
+            self.on_select(self.selected())
+        return 'break'
@@ -1,12 +1,17 @@
+from startup import profile
+profile.start_import_timing()
+
 import logging
+import os
 import threading
 from tkinter import Tk
 from ui import IPTVApp
 from config_manager import ConfigManager
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-import test_chromedriver  # Import the test script
+import http_cache
+import http_client
+import metrics
+
+profile.mark("imports")
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -34,6 +39,11 @@ def run_analysis(config_manager):
     # manager.load_default_subscriptions()
 
 def setup_chromedriver():
+    # Selenium is only imported when Chrome is actually needed
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--no-sandbox")
@@ -50,21 +60,65 @@ def setup_chromedriver():
 def main():
     setup_logging()
     config_manager = ConfigManager()
+    configure_http(config_manager)
+    configure_cache(config_manager)
+    config_manager.add_listener(lambda changed: on_config_change(config_manager, changed))
+    config_manager.watch(config_manager.get('config_watch_interval', 2.0))
+    if config_manager.get('metrics_port'):
+        # Prometheus text on http://127.0.0.1:<port>/metrics
+        metrics.serve(config_manager.get('metrics_port'))
+    if config_manager.get('additional_sources', False):
+        config_manager.resolve_sources(config_manager.get('additional_sources_deadline', 3.0))
 
-    # Run the ChromeDriver test
-    test_chromedriver.run_test()
-
-    # Initialize chromedriver at the start
-    try:
-        driver = setup_chromedriver()
-    except Exception as e:
-        logging.error(f"Failed to initialize ChromeDriver: {e}")
-        return
+    profile.mark("config")
 
     root = Tk()
-    app = IPTVApp(root, config_manager, driver)
+    # Chrome is started on first use by the opt-in fallback, never before the window is shown
+    app = IPTVApp(root, config_manager, driver_factory=setup_chromedriver)
+    profile.mark("window")
+    root.after_idle(on_first_idle, root, config_manager)
     threading.Thread(target=run_analysis, args=(config_manager,), daemon=True).start()
     root.mainloop()
 
+def configure_http(config_manager):
+    http_client.configure(
+        connect_timeout=config_manager.get('http_connect_timeout', 10),
+        read_timeout=config_manager.get('http_read_timeout', 60),
+        limit_per_host=config_manager.get('http_connections_per_host', 8),
+    )
+
+def configure_cache(config_manager):
+    http_cache.configure(
+        directory=config_manager.get('http_cache_dir', '.http_cache'),
+        max_bytes=config_manager.get('http_cache_max_mb', 512) * 1024 * 1024,
+        ttl_overrides=config_manager.get('http_cache_ttl') or {},
+        stale_while_revalidate=config_manager.get('http_cache_stale_seconds', 24 * 3600),
+    )
+
+def on_config_change(config_manager, changed):
+    # HTTP settings edited in config.yaml apply without a restart
+    if any(key.startswith('http_') and not key.startswith('http_cache_') for key in changed):
+        configure_http(config_manager)
+    if any(key.startswith('http_cache_') for key in changed):
+        configure_cache(config_manager)
+
+def on_first_idle(root, config_manager):
+    profile.mark("first idle")
+    profile.stop_import_timing()
+    # Ctrl+F12 dumps the startup profile to the log; IPTV_STARTUP_PROFILE=<path> writes it as JSON
+    root.bind_all('<Control-F12>', lambda event: profile.dump())
+    if os.environ.get('IPTV_STARTUP_PROFILE'):
+        profile.dump(os.environ['IPTV_STARTUP_PROFILE'])
+
+    if config_manager.get('chrome_self_test', False):
+        threading.Thread(target=run_chrome_self_test, daemon=True).start()
+
+def run_chrome_self_test():
+    import test_chromedriver
+    try:
+        test_chromedriver.run_test()
+    except Exception as e:
+        logging.error(f"ChromeDriver self-test failed: {e}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,220 @@
+import bisect
+import contextlib
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+__version__ = "1.0.0"
+
+# Seconds, from fast local calls up to slow portal downloads
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def render(self):
+        with self.lock:
+            return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self.values.items()]
+
+    def snapshot(self):
+        with self.lock:
+            return {key: value for key, value in self.values.items()}
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # per-bucket counts (not cumulative), then sum and count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+    def snapshot(self):
+        """{labels: {'count', 'sum', 'p50', 'p95', 'p99'}}; percentiles are bucket upper bounds."""
+        result = {}
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                entry = {'count': count, 'sum': total}
+                for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                    target = fraction * count
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                        cumulative += bucket_count
+                        if cumulative >= target:
+                            entry[name] = bound
+                            break
+                result[key] = entry
+        return result
+
+
+class Registry:
+    """In-process metric registry; metrics are created on first use and shared by name."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames, **options):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, labelnames, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text='', labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text='', labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text='', labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+_span_hook = None
+
+
+def set_span_hook(hook):
+    """Install hook(name, attributes) -> context manager or None, entered around every span.
+
+    This is where a tracer (e.g. an OpenTelemetry start_as_current_span
+    wrapper) plugs in; attributes may be updated inside the span.
+    """
+    global _span_hook
+    _span_hook = hook
+
+
+@contextlib.contextmanager
+def span(name, histogram=None, **attributes):
+    """Time an operation, observe it in histogram (labelled by attributes) and pass it to the span hook.
+
+    The yielded dict holds the span attributes; an 'error' attribute is added
+    when the operation raises.
+    """
+    hook_context = _span_hook(name, attributes) if _span_hook is not None else None
+    started = time.perf_counter()
+    try:
+        with hook_context if hook_context is not None else contextlib.nullcontext():
+            yield attributes
+    except BaseException as e:
+        attributes['error'] = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        attributes['seconds'] = elapsed
+        if histogram is not None:
+            histogram.observe(elapsed, **{label: attributes.get(label, '') for label in histogram.labelnames})
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=9464, host='127.0.0.1', registry=REGISTRY):
+    """Serve /metrics in Prometheus text format from a daemon thread; returns the server (call shutdown() to stop)."""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logging.info(f"Métriques exposées sur http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+from collections import namedtuple
+from urllib.parse import parse_qs, quote, urlencode, urlparse
+from http_cache import get_cache, read_json, release
+from http_client import get_client
+from m3u_parser import M3uParser
+from startup import lazy_import
+
+aiohttp = lazy_import('aiohttp')
+
+__version__ = "1.0.0"
+
+Category = namedtuple('Category', ['id', 'name'])
+Channel = namedtuple('Channel', ['id', 'name', 'category_id', 'url', 'logo', 'epg_id'])
+PortalContent = namedtuple('PortalContent', ['categories', 'channels'])
+
+STB_USER_AGENT = 'Mozilla/5.0 (QtEmbedded; U; Linux; C) AppleWebKit/533.3 (KHTML, like Gecko) MAG200 stbapp ver: 2 rev: 250 Safari/533.3'
+
+
+class PortalError(Exception):
+    """Raised when a portal answers with something other than the expected API response."""
+
+
+async def _cached_json(url, headers=None, vary=()):
+    """GET a catalog through the shared HTTP cache; an unreadable body is dropped so the next call refetches it."""
+    cache = get_cache()
+    response = await cache.fetch(url, headers=headers, vary=vary)
+    try:
+        return read_json(response)
+    except ValueError:
+        cache.invalidate(url, headers, vary)
+        raise
+    finally:
+        release(response)
+
+
+class XtreamClient:
+    """Xtream Codes account, read through player_api.php."""
+
+    def __init__(self, server_url, username, password):
+        self.server_url = server_url.rstrip('/')
+        self.username = username
+        self.password = password
+
+    @classmethod
+    def from_url(cls, url):
+        """Build a client from a get.php/player_api.php URL carrying username and password."""
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        if 'username' not in query or 'password' not in query:
+            raise PortalError(f"Identifiants Xtream absents de l'URL {url}")
+        return cls(f"{parsed.scheme}://{parsed.netloc}", query['username'][0], query['password'][0])
+
+    async def _api(self, action=None, cached=False, **params):
+        params.update(username=self.username, password=self.password)
+        if action:
+            params['action'] = action
+        if cached:
+            return await _cached_json(f"{self.server_url}/player_api.php?{urlencode(params)}")
+        session = await get_client().session()
+        async with session.get(f"{self.server_url}/player_api.php", params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def authenticate(self):
+        info = await self._api()
+        if not isinstance(info, dict) or not (info.get('user_info') or {}).get('auth'):
+            raise PortalError(f"Authentification Xtream refusée par {self.server_url}")
+        return info
+
+    async def get_categories(self):
+        return [Category(str(c.get('category_id')), c.get('category_name')) for c in await self._api('get_live_categories', cached=True) or []]
+
+    async def get_channels(self):
+        return [
+            Channel(
+                str(s.get('stream_id')),
+                s.get('name') or '',
+                str(s.get('category_id')),
+                f"{self.server_url}/live/{self.username}/{self.password}/{s.get('stream_id')}.ts",
+                s.get('stream_icon') or None,
+                s.get('epg_channel_id') or None,
+            )
+            for s in await self._api('get_live_streams', cached=True) or []
+        ]
+
+
+class StalkerClient:
+    """MAC/Stalker portal client: handshake, profile, then the itv channel list for the configured MAC."""
+
+    ENDPOINTS = ('portal.php', 'stalker_portal/server/load.php', 'server/load.php')
+
+    def __init__(self, portal_url, mac_address, timezone='Europe/Paris'):
+        parsed = urlparse(portal_url)
+        self.base_url = f"{parsed.scheme}://{parsed.netloc}"
+        self.portal_url = portal_url
+        self.mac_address = mac_address.upper()
+        self.timezone = timezone
+        self.endpoint = None
+        self.token = None
+        self._handshake_lock = None
+
+    @property
+    def headers(self):
+        headers = {
+            'User-Agent': STB_USER_AGENT,
+            'Cookie': f"mac={quote(self.mac_address)}; stb_lang=en; timezone={quote(self.timezone)}",
+            'Referer': self.portal_url,
+        }
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        return headers
+
+    async def _call(self, endpoint, cached=False, **params):
+        params['JsHttpRequest'] = '1-xml'
+        if cached:
+            # Keyed on the MAC cookie only: the session token changes on every handshake
+            payload = await _cached_json(f"{self.base_url}/{endpoint}?{urlencode(params)}", headers=self.headers, vary=('Cookie',))
+        else:
+            session = await get_client().session()
+            async with session.get(f"{self.base_url}/{endpoint}", params=params, headers=self.headers) as response:
+                response.raise_for_status()
+                payload = await response.json(content_type=None)
+        if not isinstance(payload, dict) or 'js' not in payload:
+            raise PortalError(f"Réponse inattendue du portail {self.base_url}/{endpoint}")
+        return payload['js']
+
+    async def handshake(self):
+        endpoints = [self.endpoint] if self.endpoint else self.ENDPOINTS
+        for endpoint in endpoints:
+            try:
+                js = await self._call(endpoint, type='stb', action='handshake', token='')
+            except (aiohttp.ClientResponseError, aiohttp.ContentTypeError, ValueError, PortalError):
+                continue
+            if isinstance(js, dict) and js.get('token'):
+                self.endpoint, self.token = endpoint, js['token']
+                await self._call(self.endpoint, type='stb', action='get_profile')
+                return self.token
+        raise PortalError(f"Échec du handshake avec le portail {self.portal_url}")
+
+    async def _ensure_session(self):
+        if self._handshake_lock is None:
+            self._handshake_lock = asyncio.Lock()
+        async with self._handshake_lock:
+            if not self.token:
+                await self.handshake()
+
+    async def get_categories(self):
+        await self._ensure_session()
+        genres = await self._call(self.endpoint, cached=True, type='itv', action='get_genres')
+        return [Category(str(g.get('id')), g.get('title')) for g in genres or []]
+
+    async def get_channels(self):
+        await self._ensure_session()
+        js = await self._call(self.endpoint, cached=True, type='itv', action='get_all_channels')
+        data = js.get('data', []) if isinstance(js, dict) else js or []
+        return [
+            Channel(
+                str(c.get('id')),
+                c.get('name') or '',
+                str(c.get('tv_genre_id')),
+                (c.get('cmd') or '').replace('ffmpeg ', '', 1).strip(),
+                c.get('logo') or None,
+                c.get('xmltv_id') or None,
+            )
+            for c in data
+        ]
+
+
+class PlaylistClient:
+    """Plain M3U playlist exposed with the same interface as the portal clients."""
+
+    def __init__(self, location):
+        self.location = location
+        self._channels = None
+
+    async def _load(self):
+        if self._channels is None:
+            loop = asyncio.get_running_loop()
+            entries = await loop.run_in_executor(None, lambda: list(M3uParser(self.location)))
+            self._channels = [
+                Channel(entry.tvg_id or str(index), entry.name, entry.group, entry.url, entry.logo, entry.tvg_id)
+                for index, entry in enumerate(entries)
+            ]
+        return self._channels
+
+    async def get_categories(self):
+        groups = dict.fromkeys(channel.category_id for channel in await self._load() if channel.category_id)
+        return [Category(group, group) for group in groups]
+
+    async def get_channels(self):
+        return await self._load()
+
+
+def guess_portal_type(url, mac_address=None):
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    if 'username' in query and 'password' in query:
+        return 'Xtream'
+    if parsed.path.endswith(('.m3u', '.m3u8')) or query.get('type') == ['m3u'] or parsed.scheme in ('', 'file'):
+        return 'Playlist'
+    if mac_address:
+        return 'Stalker Portal' if 'stalker_portal' in parsed.path else 'MAC Portal'
+    return 'Playlist'
+
+
+def client_for(url, mac_address=None, sub_type=None):
+    """Return the portal client matching a subscription type (guessed from the URL when not given)."""
+    sub_type = sub_type or guess_portal_type(url, mac_address)
+    if sub_type == 'Xtream':
+        return XtreamClient.from_url(url)
+    if sub_type in ('MAC Portal', 'Stalker Portal'):
+        if not mac_address:
+            raise PortalError(f"Adresse MAC requise pour le portail {url}")
+        return StalkerClient(url, mac_address)
+    return PlaylistClient(url)
+
+
+async def fetch_portal_content(url, mac_address=None, sub_type=None):
+    client = client_for(url, mac_address, sub_type)
+    categories, channels = await asyncio.gather(client.get_categories(), client.get_channels())
+    logging.info(f"{len(channels)} chaînes et {len(categories)} catégories récupérées depuis {url}")
+    return PortalContent(categories, channels)
@@ -0,0 +1,140 @@
+import importlib.util
+import json
+import logging
+import sys
+import threading
+import time
+
+__version__ = "1.0.0"
+
+
+def lazy_import(name):
+    """Return module `name`, deferring its execution until an attribute is first accessed."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+class _TimedLoader:
+    """Wraps a module loader to time exec_module, like `python -X importtime`."""
+
+    def __init__(self, loader, profile):
+        self.loader = loader
+        self.profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.profile._import_started()
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profile._import_finished(module.__name__, time.perf_counter() - start)
+
+
+class _ImportTimer:
+    """sys.meta_path finder that lets the other finders resolve the spec, then times its loader."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.local = threading.local()
+
+    def find_spec(self, name, path=None, target=None):
+        if getattr(self.local, 'busy', False):
+            return None
+        self.local.busy = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self.local.busy = False
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self.profile)
+        return spec
+
+
+class StartupProfile:
+    """Startup timing breakdown: phase timestamps plus per-module import times.
+
+    mark() records how long after process start each phase was reached;
+    import timing is only active between start_import_timing() and
+    stop_import_timing(), so it costs nothing once the app is running.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.imports = {}
+        self._timer = None
+        self._stack = threading.local()
+
+    def mark(self, phase):
+        elapsed = time.perf_counter() - self.started
+        self.phases.append((phase, elapsed))
+        logging.debug(f"Démarrage: {phase} à {elapsed * 1000:.0f} ms")
+
+    def start_import_timing(self):
+        if self._timer is None:
+            self._timer = _ImportTimer(self)
+            sys.meta_path.insert(0, self._timer)
+
+    def stop_import_timing(self):
+        if self._timer is not None:
+            sys.meta_path.remove(self._timer)
+            self._timer = None
+
+    def _import_started(self):
+        stack = self._stack.__dict__.setdefault('children', [])
+        stack.append(0.0)
+
+    def _import_finished(self, name, elapsed):
+        stack = self._stack.children
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        # (inclusive, self) seconds; self excludes nested imports
+        self.imports[name] = (elapsed, elapsed - children)
+
+    def report(self, top=25):
+        imports = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            'phases': [{'phase': phase, 'ms': round(elapsed * 1000, 1)} for phase, elapsed in self.phases],
+            'imports': [
+                {'module': name, 'self_ms': round(own * 1000, 1), 'cumulative_ms': round(total * 1000, 1)}
+                for name, (total, own) in imports
+            ],
+        }
+
+    def dump(self, path=None, top=25):
+        """Write the report as JSON to path, or to the log when no path is given."""
+        report = self.report(top)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            logging.info(f"Profil de démarrage écrit dans {path}")
+        else:
+            logging.info(f"Profil de démarrage: {json.dumps(report)}")
+        return report
+
+
+profile = StartupProfile()
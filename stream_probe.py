@@ -0,0 +1,236 @@
+import asyncio
+import logging
+from collections import namedtuple
+from urllib.parse import urljoin, urlparse
+from http_client import get_client
+from m3u_parser import M3uParser
+from startup import lazy_import
+
+aiohttp = lazy_import('aiohttp')
+
+__version__ = "1.0.0"
+
+ProbeResult = namedtuple('ProbeResult', ['url', 'ok', 'ttfb', 'bitrate', 'container', 'reason'])
+
+TS_PACKET = 188
+PLAYLIST_TYPES = ('application/vnd.apple.mpegurl', 'application/x-mpegurl', 'audio/mpegurl', 'audio/x-mpegurl')
+
+
+class ProbeError(Exception):
+    """A stream failed a probe step; the message is the reported failure reason."""
+
+
+def detect_container(data):
+    """Identify the container from the first bytes of a stream or segment, or return None."""
+    if data.startswith(b'ID3') and len(data) >= 10:
+        # HLS packed audio starts with an ID3 tag; look past it
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        return detect_container(data[10 + size:]) if len(data) > 10 + size else 'id3'
+    for offset in range(min(TS_PACKET, len(data))):
+        # Three sync bytes one packet apart rules out a stray 0x47
+        if all(data[offset + i * TS_PACKET:offset + i * TS_PACKET + 1] == b'\x47' for i in range(3)):
+            return 'mpegts'
+    if data[4:8] in (b'ftyp', b'styp', b'moof', b'sidx', b'moov'):
+        return 'mp4'
+    if data.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'matroska'
+    if data.startswith(b'FLV'):
+        return 'flv'
+    if data.startswith(b'\x00\x00\x01\xba'):
+        return 'mpeg-ps'
+    if len(data) >= 2 and data[0] == 0xFF and data[1] & 0xF6 == 0xF0:
+        return 'adts'
+    return None
+
+
+def parse_hls_playlist(text, base_url):
+    """Return ('master', [(bandwidth, url)], False) or ('media', [(duration, url)], encrypted) for an HLS playlist."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    variants, segments = [], []
+    encrypted = False
+    pending = None
+    for line in lines:
+        if line.startswith('#EXT-X-STREAM-INF'):
+            bandwidth = 0
+            for attribute in line.split(':', 1)[1].split(','):
+                if attribute.startswith('BANDWIDTH='):
+                    bandwidth = int(attribute[10:] or 0)
+            pending = ('variant', bandwidth)
+        elif line.startswith('#EXTINF'):
+            try:
+                duration = float(line.split(':', 1)[1].split(',', 1)[0])
+            except ValueError:
+                duration = 0.0
+            pending = ('segment', duration)
+        elif line.startswith('#EXT-X-KEY') and 'METHOD=NONE' not in line:
+            encrypted = True
+        elif not line.startswith('#') and pending is not None:
+            kind, value = pending
+            (variants if kind == 'variant' else segments).append((value, urljoin(base_url, line)))
+            pending = None
+    if variants:
+        return 'master', variants, False
+    return 'media', segments, encrypted
+
+
+class StreamProber:
+    """Checks that channels actually deliver media, without tying up a VLC player.
+
+    Each probe opens the URL on the shared HTTP session, follows HLS master
+    and media playlists down to the first segment, reads the start of the
+    media and checks its container signature (MPEG-TS sync bytes, MP4 boxes,
+    ...). Probes run concurrently under a global and a per-host cap; an
+    optional deep_check(url) callable, e.g. StreamManager.test_stream, is run
+    in a worker thread only for streams that passed the light probe.
+    """
+
+    def __init__(self, max_concurrency=50, per_host=4, timeout=15.0, sample_bytes=256 * 1024,
+                 max_playlist_depth=3, deep_check=None):
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.sample_bytes = sample_bytes
+        self.max_playlist_depth = max_playlist_depth
+        self.deep_check = deep_check
+        self._global_limit = None
+        self._deep_check_lock = None
+        self._host_limits = {}
+
+    def _host_limit(self, host):
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def _read_sample(self, response, limit, data=b'', first_byte=None):
+        """Read until limit bytes; returns (data, loop time of the first byte, seconds spent after it)."""
+        loop = asyncio.get_running_loop()
+        data = bytearray(data)
+        while len(data) < limit:
+            chunk = await response.content.readany()
+            if not chunk:
+                break
+            if first_byte is None:
+                first_byte = loop.time()
+            data += chunk
+        if first_byte is None:
+            raise ProbeError('empty response')
+        return bytes(data[:limit]), first_byte, loop.time() - first_byte
+
+    async def _open(self, session, url):
+        response = await session.get(url)
+        if response.status != 200:
+            response.release()
+            raise ProbeError(f"http {response.status}")
+        return response
+
+    def _bitrate(self, data, transfer, length=None, duration=None, declared_bitrate=None):
+        if duration and length:
+            return length * 8 / duration
+        if declared_bitrate:
+            return declared_bitrate
+        if transfer > 0:
+            # A live stream is read at roughly its own rate once the initial burst is past
+            return len(data) * 8 / transfer
+        return None
+
+    async def _probe_segment(self, session, url, duration, declared_bitrate):
+        """Read the start of an HLS segment; returns (data, bitrate)."""
+        response = await self._open(session, url)
+        try:
+            data, _, transfer = await self._read_sample(response, self.sample_bytes)
+            length = response.content_length
+        finally:
+            response.release()
+        return data, self._bitrate(data, transfer, length, duration, declared_bitrate)
+
+    async def _probe(self, session, stream_url):
+        loop = asyncio.get_running_loop()
+        url = stream_url
+        declared_bitrate = None
+        ttfb = None
+        for _ in range(self.max_playlist_depth + 1):
+            sent = loop.time()
+            response = await self._open(session, url)
+            try:
+                content_type = (response.content_type or '').lower()
+                head, first_byte, _ = await self._read_sample(response, 4096)
+                if ttfb is None:
+                    ttfb = first_byte - sent
+                if content_type not in PLAYLIST_TYPES and not head.lstrip().startswith(b'#EXTM3U'):
+                    # Continuous stream: keep sampling the same response
+                    data, _, transfer = await self._read_sample(response, self.sample_bytes, head, first_byte)
+                    return self._verdict(stream_url, data, ttfb, self._bitrate(data, transfer, declared_bitrate=declared_bitrate))
+                body = head + await response.content.read(1024 * 1024)
+                base_url = str(response.url)
+            finally:
+                response.release()
+
+            kind, entries, encrypted = parse_hls_playlist(body.decode('utf-8', 'replace'), base_url)
+            if kind == 'master':
+                if not entries:
+                    raise ProbeError('empty master playlist')
+                # The lowest variant is enough to prove the channel is alive
+                declared_bitrate, url = min(entries)
+                continue
+            if not entries:
+                raise ProbeError('empty media playlist')
+            duration, segment_url = entries[0]
+            data, bitrate = await self._probe_segment(session, segment_url, duration, declared_bitrate)
+            if encrypted:
+                # AES-128 segments cannot be inspected, but the segment was served
+                return ProbeResult(stream_url, True, ttfb, bitrate, 'encrypted', None)
+            return self._verdict(stream_url, data, ttfb, bitrate)
+        raise ProbeError('too many nested playlists')
+
+    def _verdict(self, url, data, ttfb, bitrate):
+        container = detect_container(data)
+        if container is None:
+            reason = 'html page' if data.lstrip()[:1] == b'<' else 'unknown container'
+            return ProbeResult(url, False, ttfb, None, None, reason)
+        return ProbeResult(url, True, ttfb, bitrate, container, None)
+
+    async def probe(self, url):
+        """Probe one stream URL and return a ProbeResult (never raises for stream failures)."""
+        if self._global_limit is None:
+            self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        session = await get_client().session()
+        async with self._global_limit, self._host_limit(urlparse(url).netloc):
+            try:
+                result = await asyncio.wait_for(self._probe(session, url), self.timeout)
+            except ProbeError as e:
+                result = ProbeResult(url, False, None, None, None, str(e))
+            except asyncio.TimeoutError:
+                result = ProbeResult(url, False, None, None, None, 'timeout')
+            except (aiohttp.ClientError, OSError) as e:
+                result = ProbeResult(url, False, None, None, None, f"connection error: {str(e) or type(e).__name__}")
+        if result.ok and self.deep_check is not None:
+            if self._deep_check_lock is None:
+                self._deep_check_lock = asyncio.Lock()
+            loop = asyncio.get_running_loop()
+            # A VLC check holds a player, so deep checks run one at a time
+            async with self._deep_check_lock:
+                passed = await loop.run_in_executor(None, self.deep_check, result.url)
+            if not passed:
+                result = result._replace(ok=False, reason='vlc playback failed')
+        return result
+
+    async def run(self, urls):
+        """Yield a ProbeResult for each URL as soon as its probe completes."""
+        tasks = [asyncio.ensure_future(self.probe(url)) for url in urls]
+        try:
+            for future in asyncio.as_completed(tasks):
+                result = await future
+                if not result.ok:
+                    logging.info(f"Flux en échec {result.url}: {result.reason}")
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def probe_playlist(location, prober=None):
+    """Probe every channel of an M3U playlist; returns {url: ProbeResult}."""
+    prober = prober or StreamProber()
+    loop = asyncio.get_running_loop()
+    entries = await loop.run_in_executor(None, lambda: list(M3uParser(location)))
+    return {result.url: result async for result in prober.run(dict.fromkeys(entry.url for entry in entries))}
@@ -1,48 +1,258 @@
-import vlc
-
 import logging
 
+import sys
+
+import threading
+
 import time
 
+from collections import OrderedDict
+
 from tkinter import messagebox
 
+import metrics
+
+from startup import lazy_import
+
+
+vlc = lazy_import('vlc')
 
 __version__ = "2.0.0"
 
+PLAYBACK_STARTUP = metrics.histogram('checkerip_playback_startup_seconds', "Time from opening a stream to VLC playing it", ('mode',))
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_instance():
+	"""Return the process-wide VLC instance, creating it on first use."""
+	global _instance
+	with _instance_lock:
+		if _instance is None:
+			_instance = vlc.Instance()
+		return _instance
+
+
+def set_window(player, window_id):
+	if sys.platform.startswith('win'):
+		player.set_hwnd(window_id)
+	elif sys.platform == 'darwin':
+		player.set_nsobject(window_id)
+	else:
+		player.set_xwindow(window_id)
+
+
+class EventPlayer:
+	"""A VLC media player whose state changes arrive through its event manager.
+
+	VLC raises events on its own thread, where calling back into libvlc
+	deadlocks, so every handler goes through dispatch(callback, *args): a Tk
+	caller hands in a dispatcher onto the Tk thread, otherwise each handler
+	runs on a short-lived thread.
+	"""
+
+	def __init__(self, instance, dispatch=None):
+		self.instance = instance
+		self.player = instance.media_player_new()
+		self.dispatch = dispatch or (lambda callback, *args: threading.Thread(target=callback, args=args, daemon=True).start())
+		self.url = None
+		self.ready = False
+		self.opened_at = None
+		self.muted = False
+		self.on_playing = None
+		self.on_error = None
+		events = self.player.event_manager()
+		events.event_attach(vlc.EventType.MediaPlayerPlaying, self._playing)
+		events.event_attach(vlc.EventType.MediaPlayerEncounteredError, self._failed)
+		events.event_attach(vlc.EventType.MediaPlayerEndReached, self._failed)
+
+	def _playing(self, event):
+		self.ready = True
+		if self.opened_at is not None:
+			PLAYBACK_STARTUP.observe(time.monotonic() - self.opened_at, mode='preload' if self.muted else 'play')
+			self.opened_at = None
+		if self.on_playing is not None:
+			self.dispatch(self.on_playing, self.url)
+
+	def _failed(self, event):
+		self.ready = False
+		if self.on_error is not None:
+			self.dispatch(self.on_error, self.url)
+
+	def open(self, url, window_id=None, muted=False, on_playing=None, on_error=None, options=()):
+		self.url = url
+		self.ready = False
+		self.on_playing = on_playing
+		self.on_error = on_error
+		self.opened_at = time.monotonic()
+		self.muted = muted
+		self.player.set_media(self.instance.media_new(url, *options))
+		if window_id is not None:
+			set_window(self.player, window_id)
+		self.player.audio_set_mute(muted)
+		self.player.play()
+
+	def stop(self):
+		self.on_playing = self.on_error = None
+		self.url = None
+		self.ready = False
+		self.player.stop()
+
+	def release(self):
+		self.stop()
+		self.player.release()
+
 
 class StreamManager:
 
-	def __init__(self):
-		self.instance = vlc.Instance()
-		self.player = self.instance.media_player_new()
+	def __init__(self, instance=None, dispatch=None):
+		self.instance = instance or get_instance()
+		self.dispatch = dispatch
+		self.player = EventPlayer(self.instance, dispatch)
+
+	def test_stream(self, stream_url, mac=None, timeout=5):
+		"""Play the stream on a private muted player until it starts or fails; True if it started."""
+		done = threading.Event()
+		result = []
 
-	def test_stream(self, stream_url, mac):
+		def finished(ok):
+			result.append(ok)
+			done.set()
+
+		player = EventPlayer(self.instance)
 		try:
-			media = self.instance.media_new(stream_url)
-			self.player.set_media(media)
-			self.player.play()
-			time.sleep(2)
-			state = self.player.get_state()
-			self.player.stop()
-			return state == vlc.State.Playing
+			player.open(stream_url, muted=True, options=(':no-video',),
+				on_playing=lambda url: finished(True), on_error=lambda url: finished(False))
+			done.wait(timeout)
+			return bool(result) and result[0]
 		except Exception as e:
 			logging.error(f"Error testing stream {stream_url} with MAC {mac}: {e}")
 			return False
+		finally:
+			player.release()
 
-	def play_with_vlc(self, stream_url):
+	def play(self, stream_url, window_id=None, on_playing=None, on_error=None):
+		"""Start playback; on_playing(url) / on_error(url) fire once VLC reports the outcome."""
 		try:
-			media = self.instance.media_new(stream_url)
-			self.player.set_media(media)
-			self.player.play()
-
-			while True:
-				state = self.player.get_state()
-				if state == vlc.State.Playing:
-					messagebox.showinfo("Info", "Stream is playing...")
-					break
-				elif state in [vlc.State.Error, vlc.State.Ended]:
-					messagebox.showwarning("Warning", "Unable to play the stream.")
-					break
+			self.player.open(stream_url, window_id, on_playing=on_playing, on_error=on_error)
 		except Exception as e:
 			logging.error(f"Error playing stream with VLC: {e}")
-			messagebox.showerror("Error", "Error attempting to play with VLC.")
+			if on_error is not None:
+				on_error(stream_url)
+
+	def play_with_vlc(self, stream_url, window_id=None):
+		# Message boxes are Tk calls, so this needs a dispatcher onto the Tk thread
+		self.play(
+			stream_url,
+			window_id,
+			on_playing=lambda url: messagebox.showinfo("Info", "Stream is playing..."),
+			on_error=lambda url: messagebox.showwarning("Warning", "Unable to play the stream."),
+		)
+
+	def stop(self):
+		self.player.stop()
+
+
+class ZapPool:
+	"""Pre-opened players for the channels the viewer is likely to switch to next.
+
+	preload() starts the given channels muted, each on its own surface from
+	surface_factory(), and keeps them playing so their buffers stay warm;
+	zap() to a preloaded channel just unmutes it and calls show(surface),
+	with no connect-and-buffer cycle. Channels outside the pool fall back to
+	a normal start on the current player. The channel just left stays warm
+	while a slot is free, for zapping back. Players are recycled least
+	recently used first, and never the one on screen.
+	"""
+
+	def __init__(self, size=3, instance=None, dispatch=None, surface_factory=None, show=None):
+		self.size = size
+		self.instance = instance or get_instance()
+		self.dispatch = dispatch
+		self.surface_factory = surface_factory or (lambda: None)
+		self.show = show or (lambda surface: None)
+		self.slots = OrderedDict()  # url -> (EventPlayer, surface)
+		self.idle = []
+		self.current = None
+		self.zapped_from = None
+
+	def _take_slot(self):
+		if self.idle:
+			return self.idle.pop()
+		if len(self.slots) < self.size + 1:
+			return EventPlayer(self.instance, self.dispatch), self.surface_factory()
+		for url in self.slots:
+			if url != self.current:
+				slot = self.slots.pop(url)
+				slot[0].stop()
+				return slot
+		return None
+
+	def _window_id(self, surface):
+		return surface.winfo_id() if hasattr(surface, 'winfo_id') else surface
+
+	def preload(self, urls):
+		"""Warm up to size channels (in priority order) and release the others."""
+		wanted = [url for url in dict.fromkeys(urls) if url != self.current][:self.size]
+		if len(wanted) < self.size and self.zapped_from in self.slots and self.zapped_from not in wanted:
+			wanted.append(self.zapped_from)
+		for url in [url for url in self.slots if url != self.current and url not in wanted]:
+			player, surface = self.slots.pop(url)
+			player.stop()
+			self.idle.append((player, surface))
+		for url in wanted:
+			if url in self.slots:
+				continue
+			slot = self._take_slot()
+			if slot is None:
+				break
+			player, surface = slot
+			player.open(url, self._window_id(surface), muted=True, on_error=self._drop)
+			self.slots[url] = slot
+
+	def _drop(self, url):
+		if url != self.current and url in self.slots:
+			player, surface = self.slots.pop(url)
+			player.stop()
+			self.idle.append((player, surface))
+
+	def zap(self, url, on_playing=None, on_error=None):
+		"""Switch to url; returns True when it was already warm in the pool."""
+		started = time.monotonic()
+		previous = self.slots.get(self.current)
+		slot = self.slots.get(url)
+		warm = slot is not None and slot[0].ready
+		if slot is None:
+			slot = self._take_slot() or previous
+			player, surface = slot
+			if slot is previous:
+				self.slots.pop(self.current)
+			player.open(url, self._window_id(surface), on_playing=on_playing, on_error=on_error)
+			self.slots[url] = slot
+		else:
+			player, surface = slot
+			player.on_playing, player.on_error = on_playing, on_error
+			player.player.audio_set_mute(False)
+			if warm and on_playing is not None:
+				on_playing(url)
+		self.slots.move_to_end(url)
+		self.show(surface)
+		if previous is not None and previous is not slot:
+			# The channel we left stays warm in the pool for zapping back
+			previous[0].player.audio_set_mute(True)
+			previous[0].on_playing, previous[0].on_error = None, self._drop
+		if self.current != url:
+			self.zapped_from = self.current
+		self.current = url
+		if warm:
+			PLAYBACK_STARTUP.observe(time.monotonic() - started, mode='warm_zap')
+		return warm
+
+	def close(self):
+		for player, surface in list(self.slots.values()) + self.idle:
+			player.release()
+		self.slots.clear()
+		self.idle = []
+		self.current = None
+		self.zapped_from = None
@@ -0,0 +1,157 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+__version__ = "1.0.0"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    mac TEXT NOT NULL DEFAULT '',
+    type TEXT,
+    active INTEGER NOT NULL DEFAULT 1,
+    added_at REAL NOT NULL,
+    UNIQUE (url, mac)
+);
+CREATE TABLE IF NOT EXISTS channel_cache (
+    subscription_id INTEGER PRIMARY KEY REFERENCES subscriptions (id) ON DELETE CASCADE,
+    fetched_at REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS health_history (
+    subscription_id INTEGER NOT NULL REFERENCES subscriptions (id) ON DELETE CASCADE,
+    checked_at REAL NOT NULL,
+    ok INTEGER NOT NULL,
+    latency REAL
+);
+CREATE INDEX IF NOT EXISTS idx_health_history ON health_history (subscription_id, checked_at);
+"""
+
+SUBSCRIPTION_TYPES = ('Xtream', 'MAC Portal', 'Stalker Portal', 'Fichier Playlist', 'Playlist')
+
+
+class SubscriptionStore:
+    """Durable store for all subscriptions, their cached channel lists and health history.
+
+    Backed by SQLite in WAL mode. Reads run on the caller's thread; writes are
+    queued to a single writer thread, each in its own transaction, so callers
+    on the Tk thread never wait on disk I/O.
+    """
+
+    def __init__(self, db_path='subscriptions.db', history_limit=500):
+        self.db_path = db_path
+        self.history_limit = history_limit
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.executescript(SCHEMA)
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='subscription-store', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            operation = self._writes.get()
+            if operation is None:
+                conn.close()
+                self._writes.task_done()
+                return
+            statement, params = operation
+            try:
+                with conn:
+                    conn.execute(statement, params)
+            except sqlite3.Error as e:
+                logging.error(f"Erreur d'écriture dans le stockage des abonnements: {e}")
+            finally:
+                self._writes.task_done()
+
+    def _write(self, statement, params=()):
+        self._writes.put((statement, params))
+
+    def flush(self):
+        """Block until every queued write has been committed."""
+        self._writes.join()
+
+    def close(self):
+        """Commit the queued writes, then close both connections."""
+        self._writes.put(None)
+        self._writer.join()
+        with self._read_lock:
+            self._reader.close()
+
+    def _query(self, statement, params=()):
+        with self._read_lock:
+            return self._reader.execute(statement, params).fetchall()
+
+    def add(self, url, mac=None, sub_type=None, active=True):
+        self._write(
+            "INSERT INTO subscriptions (url, mac, type, active, added_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (url, mac) DO UPDATE SET type = COALESCE(excluded.type, type), active = excluded.active",
+            (url, mac or '', sub_type, int(active), time.time()),
+        )
+
+    def remove(self, url, mac=None):
+        self._write("DELETE FROM subscriptions WHERE url = ? AND mac = ?", (url, mac or ''))
+
+    def set_active(self, url, mac, active):
+        self._write("UPDATE subscriptions SET active = ? WHERE url = ? AND mac = ?", (int(active), url, mac or ''))
+
+    def load_all(self):
+        """Return {url: [device dict, ...]} in the shape SubscriptionManager.subscriptions uses."""
+        subscriptions = {}
+        for url, mac, sub_type, active in self._query("SELECT url, mac, type, active FROM subscriptions ORDER BY id"):
+            subscriptions.setdefault(url, []).append({'mac': mac or None, 'active': bool(active), 'type': sub_type})
+        return subscriptions
+
+    def last_subscription(self):
+        rows = self._query("SELECT url, mac FROM subscriptions WHERE active = 1 ORDER BY added_at DESC LIMIT 1")
+        return (rows[0][0], rows[0][1] or None) if rows else None
+
+    def save_channels(self, url, mac, channels):
+        self._write(
+            "INSERT OR REPLACE INTO channel_cache (subscription_id, fetched_at, payload) "
+            "SELECT id, ?, ? FROM subscriptions WHERE url = ? AND mac = ?",
+            (time.time(), json.dumps(channels), url, mac or ''),
+        )
+
+    def load_channels(self, url, mac=None):
+        """Return (fetched_at, channels) from the cache, or None."""
+        rows = self._query(
+            "SELECT c.fetched_at, c.payload FROM channel_cache c JOIN subscriptions s ON s.id = c.subscription_id "
+            "WHERE s.url = ? AND s.mac = ?",
+            (url, mac or ''),
+        )
+        return (rows[0][0], json.loads(rows[0][1])) if rows else None
+
+    def record_health(self, url, mac, ok, latency=None, checked_at=None):
+        checked_at = time.time() if checked_at is None else checked_at
+        self._write(
+            "INSERT INTO health_history (subscription_id, checked_at, ok, latency) "
+            "SELECT id, ?, ?, ? FROM subscriptions WHERE url = ? AND mac = ?",
+            (checked_at, int(ok), latency, url, mac or ''),
+        )
+        # Keep only the most recent history_limit entries per subscription.
+        self._write(
+            "DELETE FROM health_history WHERE subscription_id = (SELECT id FROM subscriptions WHERE url = ? AND mac = ?) "
+            "AND checked_at < (SELECT checked_at FROM health_history WHERE subscription_id = "
+            "(SELECT id FROM subscriptions WHERE url = ? AND mac = ?) ORDER BY checked_at DESC LIMIT 1 OFFSET ?)",
+            (url, mac or '', url, mac or '', self.history_limit - 1),
+        )
+
+    def health_history(self, url, mac=None, limit=100):
+        return self._query(
+            "SELECT h.checked_at, h.ok, h.latency FROM health_history h JOIN subscriptions s ON s.id = h.subscription_id "
+            "WHERE s.url = ? AND s.mac = ? ORDER BY h.checked_at DESC LIMIT ?",
+            (url, mac or '', limit),
+        )
@@ -1,15 +1,43 @@
 import re
 import logging
 import asyncio
+import time
+from urllib.parse import parse_qs, urlparse
 from connection_to_server import ServerConnection
 from error_handling import ConnectionError
+from health_check import AdaptiveInterval, CheckScheduler, HealthCheck, HealthHistory
+from m3u_parser import M3uParser
+from subscription_store import SubscriptionStore
 
 __version__ = "2.0.0"
 
 class SubscriptionManager:
-    def __init__(self):
-        self.subscriptions = {}
-        self.connectivity_failures = {}
+    def __init__(self, scheduler=None, store=None, policy=None, history_size=64):
+        self._subscriptions = None
+        self.histories = {}
+        self.history_size = history_size
+        self.connections = {}
+        self.scheduler = scheduler or CheckScheduler()
+        self.policy = policy or AdaptiveInterval()
+        self.store = store if store is not None else SubscriptionStore()
+
+    @property
+    def subscriptions(self):
+        # Loaded from the store on first access so startup does not pay for it.
+        if self._subscriptions is None:
+            self._subscriptions = self.store.load_all()
+        return self._subscriptions
+
+    @subscriptions.setter
+    def subscriptions(self, value):
+        self._subscriptions = value
+
+    def get_connection(self, server_url, mac_address=None):
+        # Connections are cached so repeated checks reuse the shared HTTP client's pool.
+        key = (server_url, mac_address)
+        if key not in self.connections:
+            self.connections[key] = ServerConnection(server_url, mac_address)
+        return self.connections[key]
 
     def parse_data(self, data):
         url_pattern = r'(http[^\\s]+)'
@@ -20,13 +48,20 @@ class SubscriptionManager:
 
         return urls, devices
 
-    async def add_subscription_async(self, server_url, mac_address=None):
-        connection = ServerConnection(server_url, mac_address)
+    async def add_subscription_async(self, server_url, mac_address=None, sub_type=None):
+        connection = self.get_connection(server_url, mac_address)
         try:
-            if await connection.connect():
-                if server_url not in self.subscriptions:
-                    self.subscriptions[server_url] = []
-                self.subscriptions[server_url].append({'mac': mac_address, 'active': True})
+            # Bulk imports start one task per entry: the scheduler's per-host limits keep a provider from getting them all at once
+            async with self.scheduler.limit(server_url):
+                connected = await connection.connect()
+            if connected:
+                devices = self.subscriptions.setdefault(server_url, [])
+                device = next((d for d in devices if d['mac'] == mac_address), None)
+                if device is None:
+                    devices.append({'mac': mac_address, 'active': True, 'type': sub_type})
+                else:
+                    device['active'] = True
+                self.store.add(server_url, mac_address, sub_type)
                 return True
         except ConnectionError:
             logging.warning(f"Failed to connect to server {server_url} with MAC {mac_address}")
@@ -56,9 +91,12 @@ class SubscriptionManager:
 
     async def load_subscriptions_from_m3u(self, m3u_url):
         try:
-            parser = M3uParser(m3u_url)
-            playlist = parser.get_playlist()
-            tasks = [self.add_subscription_async(item['url'], item['mac']) for item in playlist]
+            # Downloading and parsing the playlist would block the event loop
+            entries = await asyncio.get_running_loop().run_in_executor(None, lambda: list(M3uParser(m3u_url)))
+            tasks = [
+                self.add_subscription_async(entry.url, parse_qs(urlparse(entry.url).query).get('mac', [None])[0])
+                for entry in entries
+            ]
             results = await asyncio.gather(*tasks)
             logging.info(f"Subscription results: {results}")
             return results
@@ -66,25 +104,79 @@ class SubscriptionManager:
             logging.error(f"Error loading subscriptions from m3u: {e}")
             return []
 
+    def history(self, url, mac=None):
+        # Seeded from the store the first time, so the adaptive schedule survives restarts
+        key = (url, mac)
+        if key not in self.histories:
+            history = HealthHistory(self.history_size)
+            for checked_at, ok, latency in reversed(self.store.health_history(url, mac, self.history_size)):
+                history.append(checked_at, ok, latency)
+            self.histories[key] = history
+        return self.histories[key]
+
+    def health_summary(self, url, mac=None):
+        """Uptime, latency percentiles and next scheduled check for one subscription, for display."""
+        history = self.history(url, mac)
+        percentiles = history.latency_percentiles()
+        return {
+            'checks': len(history),
+            'uptime': history.uptime(),
+            'latency_p50': percentiles[0.5],
+            'latency_p95': percentiles[0.95],
+            'latency_p99': percentiles[0.99],
+            'interval': self.policy.interval(history),
+            'next_check': self.policy.next_due(history),
+        }
+
+    async def iter_connectivity_async(self, due_only=False):
+        """Check stored devices through the scheduler, yielding CheckResults as they complete.
+
+        With due_only, only active devices whose adaptive interval has elapsed are checked.
+        """
+        devices = {}
+        checks = []
+        now = time.time()
+        for url, url_devices in self.subscriptions.items():
+            for device in url_devices:
+                if due_only and not (device['active'] and self.policy.is_due(self.history(url, device['mac']), now)):
+                    continue
+                devices[(url, device['mac'])] = device
+                checks.append(HealthCheck(url, device['mac'], self.get_connection(url, device['mac']).check_once))
+        async for result in self.scheduler.run(checks):
+            self._record_check_result(result.url, devices[(result.url, result.mac)], result)
+            yield result
+
+    async def monitor_async(self, poll_interval=30.0):
+        """Check active devices forever, each on its own adaptive interval, yielding every CheckResult."""
+        while True:
+            async for result in self.iter_connectivity_async(due_only=True):
+                yield result
+            due = [self.policy.next_due(self.history(url, device['mac']))
+                   for url, devices in self.subscriptions.items() for device in devices if device['active']]
+            await asyncio.sleep(max(1.0, min([poll_interval] + [when - time.time() for when in due])))
+
     async def check_connectivity_async(self):
-        tasks = []
-        for url, devices in self.subscriptions.items():
-            for device in devices:
-                tasks.append(self._check_device_connectivity_async(url, device))
-        await asyncio.gather(*tasks)
+        return [result async for result in self.iter_connectivity_async()]
 
     async def _check_device_connectivity_async(self, url, device):
-        connection = ServerConnection(url, device['mac'])
-        try:
-            if not await connection.connect():
-                self.connectivity_failures[device['mac']] = self.connectivity_failures.get(device['mac'], 0) + 1
-                if self.connectivity_failures[device['mac']] >= 3:
-                    logging.warning(f"L'abonnement avec MAC {device['mac']} a été désactivé après 3 échecs de connexion.")
-                    device['active'] = False
-            else:
-                self.connectivity_failures[device['mac']] = 0
-        except ConnectionError:
-            logging.error(f"Error checking connectivity for {device['mac']}")
+        check = HealthCheck(url, device['mac'], self.get_connection(url, device['mac']).check_once)
+        async for result in self.scheduler.run([check]):
+            self._record_check_result(url, device, result)
+            return result
+
+    def _record_check_result(self, url, device, result):
+        checked_at = time.time()
+        history = self.history(url, device['mac'])
+        history.append(checked_at, result.ok, result.latency)
+        self.store.record_health(url, device['mac'], result.ok, result.latency, checked_at)
+        ok, streak = history.streak()
+        if not ok and streak >= 3 and device['active']:
+            logging.warning(f"L'abonnement avec MAC {device['mac']} a été désactivé après 3 échecs de connexion.")
+            device['active'] = False
+            self.store.set_active(url, device['mac'], False)
+
+    def shutdown(self):
+        self.scheduler.shutdown()
 
 if __name__ == "__main__":
     manager = SubscriptionManager()
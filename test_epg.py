@@ -0,0 +1,104 @@
+import gzip
+import io
+import lzma
+import zipfile
+import pytest
+from epg import GuideMerger, Programme, iter_channel_programmes, merge_guides, open_xmltv_stream, parse_xmltv_time
+
+GUIDE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<tv>
+  <channel id="tf1.fr"><display-name>TF1</display-name></channel>
+  <programme channel="tf1.fr" start="20240101120000 +0100" stop="20240101130000 +0100"><title>Journal</title></programme>
+  <programme channel="tf1.fr" start="20240101130000 +0100" stop="20240101140000 +0100"><title>Film</title></programme>
+  <programme channel="m6.fr" start="20240101120000 +0000" stop="20240101123000 +0000"><title>Info</title></programme>
+</tv>
+"""
+
+
+def chunked(data, size=7):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+class Unseekable(io.RawIOBase):
+    """Output stream zipfile cannot seek back into, as when an archive is written on the fly."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+def zipped(streamed):
+    # Written to an unseekable stream, members carry their sizes in a data descriptor after the data
+    output = Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('readme.txt', b'not a guide')
+        with archive.open('guide.xml', 'w') as member:
+            member.write(GUIDE)
+    return bytes(output.data) if streamed else output.getvalue()
+
+
+def stored_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr('guide.xml', GUIDE)
+    return buffer.getvalue()
+
+
+def read_documents(data):
+    return [(name, stream.read()) for name, stream in open_xmltv_stream(chunked(data), 'guide')]
+
+
+@pytest.mark.parametrize('data', [GUIDE, gzip.compress(GUIDE), lzma.compress(GUIDE)], ids=['xml', 'gz', 'xz'])
+def test_open_xmltv_stream_single_document(data):
+    assert read_documents(data) == [('guide', GUIDE)]
+
+
+@pytest.mark.parametrize('data', [zipped(False), zipped(True), stored_zip()], ids=['deflated', 'descriptor', 'stored'])
+def test_open_xmltv_stream_zip_members(data):
+    assert read_documents(data) == [('guide.xml', GUIDE)]
+
+
+def test_iter_channel_programmes_from_gzip_stream():
+    (_, stream), = open_xmltv_stream(chunked(gzip.compress(GUIDE)))
+    groups = [(channel_id, [p.title for p in programmes]) for channel_id, programmes in iter_channel_programmes(stream)]
+    assert groups == [('tf1.fr', ['Journal', 'Film']), ('m6.fr', ['Info'])]
+
+
+def test_parse_xmltv_time():
+    assert parse_xmltv_time('20240101120000 +0100') == 1704106800
+    assert parse_xmltv_time('20240101110000') == 1704106800
+    assert parse_xmltv_time('') is None
+    with pytest.raises(ValueError):
+        parse_xmltv_time('2024')
+
+
+def programme(start, stop, title):
+    return Programme('c', start, stop, title, None)
+
+
+def test_merge_guides_higher_priority_wins_overlaps():
+    primary = {'c': [programme(0, 100, 'primary')]}
+    secondary = {'c': [programme(50, 150, 'overlaps'), programme(100, 200, 'fills gap')], 'd': [programme(0, 10, 'only')]}
+    merged = merge_guides([(1, secondary), (0, primary)])
+    assert [p.title for p in merged['c']] == ['primary', 'fills gap']
+    assert [p.title for p in merged['d']] == ['only']
+
+
+def test_guide_merger_replaces_lower_priority_run():
+    merger = GuideMerger()
+    merger.add(1, {'c': [programme(0, 50, 'a'), programme(50, 100, 'b'), programme(100, 150, 'c')]})
+    merger.add(0, {'c': [programme(40, 110, 'better')]})
+    assert [p.title for p in merger.result()['c']] == ['better']
+    assert merger.sources == 2
+
+
+def test_guide_merger_skips_programmes_without_times():
+    merger = GuideMerger()
+    merger.add(0, {'c': [programme(None, 10, 'no start'), programme(0, 10, 'kept')]})
+    assert [p.title for p in merger.result()['c']] == ['kept']
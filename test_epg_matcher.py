@@ -0,0 +1,42 @@
+import pytest
+from epg_matcher import EpgMatcher, channel_key, id_key
+
+CHANNELS = [
+    ('TF1.fr', ['TF1']),
+    ('France2.fr', ['France 2']),
+    ('BBCOne.uk', ['BBC One', 'BBC 1']),
+    ('Eurosport1.fr', ['Eurosport 1']),
+]
+
+
+@pytest.fixture
+def matcher():
+    return EpgMatcher(CHANNELS, overrides={'bfm': 'BFMTV.fr'})
+
+
+def test_channel_key_strips_prefix_and_quality_tags():
+    assert channel_key('FR| TF1 FHD') == 'tf1'
+    assert channel_key('[UK] BBC One HD') == 'bbc one'
+    assert channel_key('HD') == 'hd'
+    assert id_key('BBCOne.uk') == 'bbcone'
+
+
+def test_match_tiers(matcher):
+    assert matcher.match('BFM') == ('BFMTV.fr', 'override', 1.0)
+    assert matcher.match('Anything', 'tf1.FR') == ('TF1.fr', 'tvg-id', 1.0)
+    assert matcher.match('FR: France 2 HD') == ('France2.fr', 'exact', 1.0)
+    fuzzy = matcher.match('Eurosport 1 Extra')
+    assert (fuzzy.channel_id, fuzzy.method) == ('Eurosport1.fr', 'fuzzy')
+    assert 0.6 <= fuzzy.score < 1.0
+    assert matcher.match('Completely Unrelated') is None
+
+
+def test_override_takes_precedence_over_tvg_id(matcher):
+    matcher.set_override('TF1 HD', 'TF1Series.fr')
+    assert matcher.match('TF1', 'TF1.fr') == ('TF1Series.fr', 'override', 1.0)
+    matcher.set_override('TF1', None)
+    assert matcher.match('TF1', 'TF1.fr').method == 'tvg-id'
+
+
+def test_unknown_tvg_id_falls_back_to_name(matcher):
+    assert matcher.match('UK: BBC 1', 'missing.id') == ('BBCOne.uk', 'exact', 1.0)
@@ -0,0 +1,50 @@
+import time
+import pytest
+from epg import Programme
+from epg_store import EpgStore
+
+HOUR = 3600
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EpgStore(str(tmp_path / 'epg.db'))
+    yield store
+    store.close()
+
+
+def programmes(channel_id, base, titles):
+    return [Programme(channel_id, base + i * HOUR, base + (i + 1) * HOUR, title, None) for i, title in enumerate(titles)]
+
+
+def starts(store, channel_id, base):
+    return [row[1] - base for row in store.grid([channel_id], base - 10 * HOUR, base + 10 * HOUR)[channel_id]]
+
+
+def test_import_guide_removes_programmes_missing_from_window(store):
+    base = int(time.time()) // HOUR * HOUR
+    store.import_guide([('a', programmes('a', base, ['1', '2', '3', '4']))])
+    # Second import drops the 2nd slot and stops before the 4th
+    kept = programmes('a', base, ['1', '2', '3', '4'])
+    assert store.import_guide([('a', [kept[0], kept[2]])]) == 2
+    # Inside the new window [start of 1st, start of 3rd] the gap is deleted, the 4th survives outside it
+    assert starts(store, 'a', base) == [0, 2 * HOUR, 3 * HOUR]
+
+
+def test_import_guide_leaves_other_channels_alone(store):
+    base = int(time.time()) // HOUR * HOUR
+    store.import_guide([('a', programmes('a', base, ['1', '2'])), ('b', programmes('b', base, ['x', 'y']))])
+    store.import_guide([('a', programmes('a', base, ['1 bis']))])
+    assert starts(store, 'b', base) == [0, HOUR]
+    current, following = store.now_next('a', base + 10)
+    assert current[3] == '1 bis'
+    assert following[3] == '2'
+
+
+def test_import_guide_prunes_expired_and_skips_untimed(store):
+    base = int(time.time()) // HOUR * HOUR
+    old = Programme('a', base - 3 * 24 * HOUR, base - 3 * 24 * HOUR + HOUR, 'old', None)
+    untimed = Programme('a', None, base, 'untimed', None)
+    assert store.import_guide([('a', [old, untimed] + programmes('a', base, ['now']))]) == 2
+    assert starts(store, 'a', base) == [0]
+    assert store.search_titles('NO', base, base + HOUR)[0][3] == 'now'
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+import pytest
+from aiohttp import web
+from http_cache import HttpCache, read_body, release
+from http_client import get_client
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HttpCache(str(tmp_path / 'cache'), stale_while_revalidate=60)
+    yield cache
+    cache.close()
+
+
+def ttl(freshness):
+    expires_at, stale_until = freshness
+    return round(expires_at - time.time()), round(stale_until - expires_at)
+
+
+def test_freshness_from_headers(cache):
+    assert ttl(cache._freshness('http://a/x', {'Cache-Control': 'max-age=100'}, None)) == (100, 60)
+    assert ttl(cache._freshness('http://a/x', {'cache-control': 'max-age=100', 'Age': '40'}, None)) == (60, 60)
+    assert ttl(cache._freshness('http://a/x', {'Cache-Control': 'max-age=100, stale-while-revalidate=5'}, None)) == (100, 5)
+    assert ttl(cache._freshness('http://a/x', {'Cache-Control': 'max-age=100, must-revalidate'}, None)) == (100, 0)
+    assert ttl(cache._freshness('http://a/x', {'Cache-Control': 'no-cache'}, None)) == (0, 0)
+    assert ttl(cache._freshness('http://a/x', {'ETag': '"v1"'}, None)) == (0, 60)
+    assert cache._freshness('http://a/x', {'Cache-Control': 'no-store, max-age=100'}, None) is None
+
+
+def test_freshness_ttl_overrides(cache):
+    cache.ttl_overrides = {'http://epg/*': 500}
+    assert ttl(cache._freshness('http://epg/guide.xml', {'Cache-Control': 'max-age=10'}, None)) == (500, 60)
+    assert ttl(cache._freshness('http://epg/guide.xml', {}, 20)) == (20, 60)
+
+
+def store(cache, url, size):
+    key = cache.key(url)
+    with open(cache._path(key), 'wb') as f:
+        f.write(b'x' * size)
+    cache._store(key, url, 200, {}, size, time.time() + 100, time.time() + 200)
+    return key
+
+
+def test_eviction_skips_pinned_entries(cache):
+    cache.max_bytes = 250
+    first = store(cache, 'http://a/1', 100)
+    second = store(cache, 'http://a/2', 100)
+    with cache.pinned([first]):
+        store(cache, 'http://a/3', 100)
+        assert os.path.exists(cache._path(first))
+        assert not os.path.exists(cache._path(second))
+    store(cache, 'http://a/4', 100)
+    assert not os.path.exists(cache._path(first))
+    assert cache.size() == (200, 2)
+
+
+class Origin:
+    """Local server counting requests per path and answering conditional requests."""
+
+    def __init__(self):
+        self.requests = {}
+        self.version = 1
+
+    async def handle(self, request):
+        self.requests[request.path] = self.requests.get(request.path, 0) + 1
+        headers = {'ETag': f'"v{self.version}"'}
+        if request.path == '/swr':
+            headers['Cache-Control'] = 'max-age=0, stale-while-revalidate=60'
+        elif request.path == '/nostore':
+            headers['Cache-Control'] = 'no-store'
+        if request.headers.get('If-None-Match') == headers['ETag']:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=f'{request.path} v{self.version}'.encode(), headers=headers)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get('/{name}', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.base = f"http://127.0.0.1:{self.runner.addresses[0][1]}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await get_client().close()
+        await self.runner.cleanup()
+
+
+def test_stale_while_revalidate(cache):
+    async def scenario():
+        async with Origin() as origin:
+            url = origin.base + '/swr'
+            first = await cache.fetch(url)
+            origin.version = 2
+            stale = await cache.fetch(url)
+            # The expired copy is served at once while the refresh runs in the background
+            assert (first.source, stale.source) == ('network', 'stale')
+            assert read_body(stale) == b'/swr v1'
+            await asyncio.gather(*cache._refreshing.values())
+            # Expired again (max-age=0): background=False revalidates first, here with a 304
+            revalidated = await cache.fetch(url, background=False)
+            assert (revalidated.source, read_body(revalidated)) == ('revalidated', b'/swr v2')
+            origin.version = 3
+            changed = await cache.fetch(url, background=False)
+            assert (changed.source, read_body(changed)) == ('network', b'/swr v3')
+            assert origin.requests['/swr'] == 4
+            assert cache.stats['stale'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_revalidation_304(cache):
+    async def scenario():
+        async with Origin() as origin:
+            url = origin.base + '/etag'
+            await cache.fetch(url)
+            revalidated = await cache.fetch(url, background=False)
+            assert revalidated.source == 'revalidated'
+            assert read_body(revalidated) == b'/etag v1'
+
+    asyncio.run(scenario())
+
+
+def test_no_store_is_never_indexed(cache):
+    async def scenario():
+        async with Origin() as origin:
+            url = origin.base + '/nostore'
+            response = await cache.fetch(url)
+            assert response.source == 'uncached'
+            assert read_body(response) == b'/nostore v1'
+            release(response)
+            assert not os.path.exists(response.path)
+            assert cache.size() == (0, 0)
+            again = await cache.fetch(url)
+            assert again.source == 'uncached'
+            release(again)
+            assert origin.requests['/nostore'] == 2
+
+    asyncio.run(scenario())
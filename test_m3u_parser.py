@@ -0,0 +1,34 @@
+from m3u_parser import iter_m3u_lines, parse_extinf
+
+
+def test_parse_extinf_attributes_and_name():
+    attributes, name = parse_extinf('#EXTINF:-1 tvg-id="tf1.fr" tvg-name="TF1" group-title="France",TF1 HD')
+    assert attributes == {'tvg-id': 'tf1.fr', 'tvg-name': 'TF1', 'group-title': 'France'}
+    assert name == 'TF1 HD'
+
+
+def test_parse_extinf_keeps_quotes_in_name():
+    assert parse_extinf('#EXTINF:-1 tvg-id="tf1.fr",The "Best" Show') == ({'tvg-id': 'tf1.fr'}, 'The "Best" Show')
+    assert parse_extinf('#EXTINF:-1,"Quoted"') == ({}, '"Quoted"')
+    assert parse_extinf('#EXTINF:-1,Show a="b"') == ({}, 'Show a="b"')
+
+
+def test_parse_extinf_comma_in_attribute_value():
+    attributes, name = parse_extinf('#EXTINF:-1 group-title="Films, Séries",Movie')
+    assert attributes == {'group-title': 'Films, Séries'}
+    assert name == 'Movie'
+
+
+def test_iter_m3u_lines():
+    lines = [
+        '#EXTM3U',
+        '#EXTINF:-1 tvg-id="a" group-title="G",Channel A',
+        'http://example.com/a',
+        '#EXTINF:-1,Channel B',
+        'http://example.com/b',
+    ]
+    entries = list(iter_m3u_lines(lines))
+    assert [(entry.name, entry.url, entry.tvg_id, entry.group) for entry in entries] == [
+        ('Channel A', 'http://example.com/a', 'a', 'G'),
+        ('Channel B', 'http://example.com/b', None, None),
+    ]
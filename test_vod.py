@@ -0,0 +1,49 @@
+import pytest
+from vod import VodIndex, VodItem, VodManager
+
+TITLES = ['Alien', 'Aliens', 'Alien: Romulus', 'The Alien Factor', 'Extraterrestrial Aliens', 'Amélie', 'Zoolander']
+
+
+@pytest.fixture
+def index():
+    index = VodIndex()
+    index.add_many(enumerate(TITLES))
+    return index
+
+
+def titles(index, ids):
+    return [index.titles[item_id] for item_id in ids]
+
+
+def test_search_ranks_exact_prefix_phrase_then_substring(index):
+    assert titles(index, index.search('alien')) == ['Alien', 'Aliens', 'Alien: Romulus', 'The Alien Factor', 'Extraterrestrial Aliens']
+    # Substring-only matches come last
+    assert titles(index, index.search('lien'))[-1] == 'Extraterrestrial Aliens'
+
+
+def test_search_folds_accents_and_requires_every_token(index):
+    assert titles(index, index.search('AMELIE')) == ['Amélie']
+    assert titles(index, index.search('alien rom')) == ['Alien: Romulus']
+    assert index.search('alien zoo') == []
+
+
+def test_search_limit(index):
+    assert titles(index, index.search('alien', limit=2)) == ['Alien', 'Aliens']
+    assert index.search('') == []
+    assert titles(index, index.search('', limit=None)) == TITLES
+    assert titles(index, index.search('lien', limit=None)) == titles(index, index.search('lien'))
+
+
+def test_remove_and_re_add(index):
+    index.remove(0)
+    assert 'Alien' not in titles(index, index.search('alien'))
+    index.add(0, 'Zoolander 2')
+    assert titles(index, index.search('zoolander')) == ['Zoolander', 'Zoolander 2']
+    assert 'zoolander' in index.sorted_tokens
+
+
+def test_manager_search_vod():
+    manager = VodManager()
+    manager.load_items(VodItem(i, title, None, None) for i, title in enumerate(TITLES))
+    assert manager.search_vod('aliens') == ['Aliens', 'Extraterrestrial Aliens']
+    assert manager.search_vod('alien', limit=1) == ['Alien']
@@ -1,35 +1,97 @@
-from tkinter import messagebox, ttk, Listbox, Scrollbar, Canvas, Toplevel, Label, Entry, Menu
+from tkinter import messagebox, ttk, Canvas, Frame, Toplevel, Label, Entry, Menu, StringVar
 import asyncio
-import vlc
+import logging
 import json
 import os
+import threading
+import time
 from html.parser import HTMLParser
-from connection_to_server import ServerConnection
+from async_runner import TkAsyncBridge
+from http_client import get_client
+from list_view import VirtualListView
+from streaming import ZapPool
 from subscriptions import SubscriptionManager
 
+CONTENT_CHUNK_SIZE = 64 * 1024
+CONTENT_BATCH_SIZE = 500
+
 class IPTVContentParser(HTMLParser):
+    """Collects link targets and visible text; whitespace, scripts, styles and page-local links are dropped."""
+
+    SKIPPED_TAGS = ('script', 'style', 'noscript', 'template', 'svg')
+
     def __init__(self):
         super().__init__()
         self.content = []
+        self.skip_depth = 0
 
     def handle_starttag(self, tag, attrs):
-        if tag == "a":
-            for attr in attrs:
-                if attr[0] == "href":
-                    self.content.append(attr[1])
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag == "a":
+            for name, value in attrs:
+                if name == "href" and value and not value.startswith(('#', 'javascript:', 'mailto:')):
+                    self.content.append(value.strip())
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
 
     def handle_data(self, data):
-        self.content.append(data)
+        text = ' '.join(data.split())
+        if text and not self.skip_depth:
+            self.content.append(text)
+
+    def drain(self):
+        items, self.content = self.content, []
+        return items
+
+def parse_content(html, on_batch, max_items, chunk_size=CONTENT_CHUNK_SIZE, batch_size=CONTENT_BATCH_SIZE):
+    """Feed html to IPTVContentParser chunk by chunk, passing items to on_batch in batches; returns the item count.
+
+    Stops collecting after max_items so a huge page cannot exhaust memory.
+    """
+    parser = IPTVContentParser()
+    count = 0
+    batch = []
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+        batch.extend(parser.drain())
+        if len(batch) >= batch_size or count + len(batch) >= max_items:
+            batch = batch[:max_items - count]
+            on_batch(batch)
+            count += len(batch)
+            batch = []
+            if count >= max_items:
+                return count
+    parser.close()
+    batch.extend(parser.drain())
+    batch = batch[:max_items - count]
+    if batch:
+        on_batch(batch)
+    return count + len(batch)
 
 class IPTVApp:
-    def __init__(self, root, config_manager, driver):
+    def __init__(self, root, config_manager, driver=None, driver_factory=None):
         self.root = root
         self.config_manager = config_manager
         self.driver = driver
+        self.driver_factory = driver_factory
+        self.driver_lock = threading.Lock()
+        self.zap_pool = None
+        self.bridge = TkAsyncBridge(root)
+        self.health_check = None
+        self.health_monitor = None
         self.subscription_manager = SubscriptionManager()
         self.load_stored_subscription()
         self.create_main_widgets()
-        self.auto_connect()
+        self.update_listbox()
+        # Closing the window goes through the same shutdown as the Quit button
+        self.root.protocol('WM_DELETE_WINDOW', self.quit_app)
+        # Connect once the window has been painted; the network work runs on the loop thread.
+        self.root.after_idle(self.auto_connect)
+        if self.config_manager.get('health_monitor', True):
+            self.root.after_idle(self.start_health_monitor)
 
     def create_main_widgets(self):
         style = ttk.Style()
@@ -40,13 +102,12 @@ class IPTVApp:
 
         ttk.Label(frame, text=self.translate("Abonnements Actifs")).grid(row=0, column=0, padx=5, pady=5)
 
-        self.listbox = Listbox(frame, width=50)
-        self.listbox.grid(row=1, column=0, rowspan=6, padx=5, pady=5)
-        self.listbox.bind('<<ListboxSelect>>', self.on_subscription_select)
+        self.filter_var = StringVar()
+        self.filter_var.trace_add('write', lambda *args: self.subscription_list.set_filter(self.filter_var.get()))
+        ttk.Entry(frame, textvariable=self.filter_var, width=50).grid(row=0, column=1, columnspan=2, padx=5, pady=5)
 
-        scrollbar = Scrollbar(frame, orient='vertical', command=self.listbox.yview)
-        scrollbar.grid(row=1, column=1, rowspan=6, sticky='ns')
-        self.listbox.config(yscrollcommand=scrollbar.set)
+        self.subscription_list = VirtualListView(frame, rows=10, width=50, on_select=self.on_subscription_select)
+        self.subscription_list.grid(row=1, column=0, rowspan=6)
 
         add_provider_menu = Menu(frame, tearoff=0)
         add_provider_menu.add_command(label=self.translate("Xtream"), command=self.add_xtream)
@@ -64,6 +125,12 @@ class IPTVApp:
         self.favorite_button = ttk.Button(frame, text=self.translate("Ajouter aux Favoris"), command=self.add_to_favorites)
         self.favorite_button.grid(row=5, column=2, padx=5, pady=5)
 
+        self.check_button = ttk.Button(frame, text=self.translate("Vérifier"), command=self.toggle_health_check)
+        self.check_button.grid(row=2, column=2, padx=5, pady=5)
+
+        self.status_label = ttk.Label(frame, text="")
+        self.status_label.grid(row=7, column=0, columnspan=3, padx=5, pady=5, sticky='w')
+
         self.quit_button = ttk.Button(frame, text=self.translate("Quitter"), command=self.quit_app)
         self.quit_button.grid(row=6, column=2, padx=5, pady=5)
 
@@ -72,6 +139,20 @@ class IPTVApp:
 
     def quit_app(self):
         if messagebox.askokcancel("Quit", "Voulez-vous vraiment quitter?"):
+            async def cleanup():
+                # The scheduler's tasks live on the bridge loop
+                self.subscription_manager.shutdown()
+                await get_client().close()
+
+            self.bridge.stop(cleanup)
+            # Writes are queued to a daemon thread: commit them before the process exits
+            self.subscription_manager.store.flush()
+            self.subscription_manager.store.close()
+            if self.driver is not None:
+                self.driver.quit()
+            if self.zap_pool is not None:
+                self.zap_pool.close()
+            self.config_manager.close()
             self.root.destroy()
 
     def add_xtream(self):
@@ -107,95 +188,220 @@ class IPTVApp:
         def add_subscription():
             url = url_entry.get()
             mac = mac_entry.get() if mac_entry else None
-            self.store_subscription(url, mac)  # Store subscription for automatic connection
-            asyncio.run(self.subscription_manager.add_subscription_async(url, mac))
-            self.update_listbox()
+            self.store_subscription(url, mac, mode)  # Store subscription for automatic connection
+            self.set_status(f"Connexion à {url}...")
+            self.bridge.run(
+                lambda progress: self.subscription_manager.add_subscription_async(url, mac, mode),
+                on_done=lambda added: (self.update_listbox(), self.set_status("Abonnement ajouté" if added else f"Échec de connexion à {url}")),
+                on_error=lambda error: self.set_status(f"Erreur: {error}"),
+            )
             manual_window.destroy()
 
         add_button = ttk.Button(manual_window, text="Ajouter", command=add_subscription)
         add_button.grid(row=2, column=1, padx=5, pady=5)
 
-    def display_server_content(self, url):
+    def display_server_content(self, url, mac=None, sub_type=None):
         content_window = Toplevel(self.root)
         content_window.title("Contenu du Serveur")
 
-        connection = ServerConnection(url, self.config_manager.get('mac_address'))
-
-        def show_content():
-            content = connection.fetch_server_content(self.driver)
-            if content:
-                parser = IPTVContentParser()
-                parser.feed(content)
-                for item in parser.content:
-                    ttk.Label(content_window, text=item).pack()
+        mac = mac or self.config_manager.get('mac_address')
+        connection = self.subscription_manager.get_connection(url, mac)
+        max_items = self.config_manager.get('content_max_items', 100000)
+
+        # A single virtual list whatever the page size: only the visible rows are widgets
+        search_var = StringVar()
+        ttk.Entry(content_window, textvariable=search_var, width=100).grid(row=0, column=0, padx=5, pady=5, sticky='we')
+        def play_channel(channel):
+            # Native rows carry Channel records: selecting one zaps to it, with its neighbours kept warm
+            if getattr(channel, 'url', None):
+                neighbours = content_list.neighbours(self.config_manager.get('zap_pool_size', 3))
+                self.play_video(channel.url, [neighbour.url for neighbour in neighbours if getattr(neighbour, 'url', None)])
+
+        content_list = VirtualListView(content_window, rows=25, width=100, on_select=play_channel)
+        content_list.grid(row=1, column=0)
+        search_var.trace_add('write', lambda *args: content_list.set_filter(search_var.get()))
+        count_label = ttk.Label(content_window, text="Chargement...")
+        count_label.grid(row=2, column=0, padx=5, pady=5, sticky='w')
+
+        def show_items(items):
+            start = len(content_list.model.records)
+            content_list.append_records((start + index, item, item) for index, item in enumerate(items))
+            count_label.config(text=f"{len(content_list.model.records)} éléments...")
+
+        def show_count(count):
+            limit = f" (limité à {max_items})" if count >= max_items else ""
+            count_label.config(text=f"{count} éléments{limit}")
+
+        def show_failure():
+            count_label.config(text="Failed to fetch server content")
+
+        def show_content(content):
+            self.subscription_manager.store.save_channels(url, mac, [channel._asdict() for channel in content.channels])
+            channels = content.channels[:max_items]
+            content_list.append_records((index, f"{channel.name} - {channel.url}", channel) for index, channel in enumerate(channels))
+            show_count(len(channels))
+
+        def show_chrome_content():
+            # Opt-in fallback: render the page in headless Chrome and scrape it
+            async def fetch(progress):
+                loop = asyncio.get_running_loop()
+                driver = await loop.run_in_executor(None, self.get_driver)
+                html = await loop.run_in_executor(None, connection.fetch_server_content, driver)
+                if not html:
+                    return None
+                # Parsed on a worker thread; each batch is rendered on the Tk thread as it arrives
+                return await loop.run_in_executor(None, parse_content, html, progress, max_items)
+
+            self.bridge.run(fetch, on_progress=show_items,
+                            on_done=lambda count: show_failure() if count is None else show_count(count),
+                            on_error=lambda error: show_failure())
+
+        def on_error(error):
+            logging.warning(f"Échec de la récupération native du contenu de {url}: {error}")
+            if (self.driver is not None or self.driver_factory is not None) and self.config_manager.get('chrome_fallback', False):
+                show_chrome_content()
             else:
-                ttk.Label(content_window, text="Failed to fetch server content").pack()
+                show_failure()
 
-        show_content()
+        self.bridge.run(lambda progress: connection.fetch_content_async(sub_type), on_done=show_content, on_error=on_error)
+
+    def get_driver(self):
+        # Chrome is slow to start, so it is only launched the first time the fallback needs it
+        with self.driver_lock:
+            if self.driver is None:
+                self.driver = self.driver_factory()
+            return self.driver
 
     def translate(self, text):
         return text
 
-    def on_subscription_select(self, event):
-        selected = self.listbox.curselection()
-        if selected:
-            index = selected[0]
-            entry = self.listbox.get(index)
-            parts = entry.split(" - ")
-            url = parts[0].split(": ")[1]
-            self.display_server_content(url)
+    def set_status(self, text):
+        self.status_label.config(text=text)
+
+    def toggle_health_check(self):
+        if self.health_check is not None and not self.health_check.done():
+            self.health_check.cancel()
+            self.set_status("Vérification annulée")
+            return
+
+        async def check_all(progress):
+            done = 0
+            async for result in self.subscription_manager.iter_connectivity_async():
+                done += 1
+                progress((done, result))
+            return done
+
+        def on_progress(value):
+            done, result = value
+            state = "OK" if result.ok else f"échec ({result.error or 'statut'})"
+            self.set_status(f"{done} vérifié(s) - {result.url} {result.mac or ''}: {state}")
+
+        def on_done(total):
+            self.update_listbox()
+            self.set_status(f"Vérification terminée: {total} abonnement(s)")
+
+        self.health_check = self.bridge.run(check_all, on_done=on_done, on_progress=on_progress,
+                                            on_error=lambda error: self.set_status(f"Erreur: {error}"))
+
+    def start_health_monitor(self):
+        # Background checks, each subscription on its own adaptive interval
+        async def monitor(progress):
+            async for result in self.subscription_manager.monitor_async(self.config_manager.get('health_monitor_poll', 30)):
+                progress(result)
+
+        def on_result(result):
+            if not result.ok:
+                self.update_listbox()
+
+        self.health_monitor = self.bridge.run(monitor, on_progress=on_result,
+                                              on_error=lambda error: logging.error(f"Surveillance des abonnements arrêtée: {error}"))
+
+    def show_health(self, record):
+        summary = self.subscription_manager.health_summary(record['url'], record['mac'])
+        if not summary['checks']:
+            self.set_status(f"{record['url']}: aucune vérification enregistrée")
+            return
+        latency = " / ".join("-" if summary[name] is None else f"{summary[name] * 1000:.0f}"
+                             for name in ('latency_p50', 'latency_p95', 'latency_p99'))
+        self.set_status(f"{record['url']}: disponibilité {summary['uptime']:.0%} sur {summary['checks']} vérifications, "
+                        f"latence p50/p95/p99 {latency} ms, prochaine vérification dans {max(0, summary['next_check'] - time.time()) / 60:.0f} min")
+
+    def on_subscription_select(self, record):
+        if record:
+            self.show_health(record)
+            self.display_server_content(record['url'], record['mac'], record.get('type'))
 
     def update_listbox(self):
-        self.listbox.delete(0, 'end')
-        for url, devices in self.subscription_manager.subscriptions.items():
-            for device in devices:
-                if device['active']:
-                    self.listbox.insert('end', f"Server: {url} - MAC: {device['mac']}")
+        # Only rows whose text changed are redrawn; the selection follows the (url, mac) key.
+        self.subscription_list.set_records(
+            ((url, device['mac']), f"Server: {url} - MAC: {device['mac']}", dict(device, url=url))
+            for url, devices in self.subscription_manager.subscriptions.items()
+            for device in devices
+            if device['active']
+        )
 
     def view_stream(self):
-        selected = self.listbox.curselection()
-        if selected:
-            index = selected[0]
-            entry = self.listbox.get(index)
-            parts = entry.split(" - ")
-            url = parts[0].split(": ")[1]
-            self.play_video(url)
-
-    def play_video(self, url):
-        instance = vlc.Instance()
-        player = instance.media_player_new()
-        media = instance.media_new(url)
-        player.set_media(media)
-        player.set_xwindow(self.video_canvas.winfo_id())
-        player.play()
+        record = self.subscription_list.selected()
+        if record:
+            neighbours = self.subscription_list.neighbours(self.config_manager.get('zap_pool_size', 3))
+            self.play_video(record['url'], [neighbour['url'] for neighbour in neighbours])
+
+    def get_zap_pool(self):
+        # The pool (and libvlc) is only created on first playback
+        if self.zap_pool is None:
+            self.zap_pool = ZapPool(
+                size=self.config_manager.get('zap_pool_size', 3),
+                dispatch=self.bridge.dispatcher.post,
+                surface_factory=self.create_video_surface,
+                show=lambda surface: surface.lift(),
+            )
+        return self.zap_pool
+
+    def create_video_surface(self):
+        # One stacked frame per pooled player; zapping raises the right one
+        surface = Frame(self.video_canvas, bg='black')
+        surface.place(relx=0, rely=0, relwidth=1, relheight=1)
+        return surface
+
+    def play_video(self, url, next_urls=()):
+        """Play url, and keep next_urls (adjacent or favourite channels) pre-opened for zapping."""
+        pool = self.get_zap_pool()
+        pool.zap(
+            url,
+            on_playing=lambda url: self.set_status(f"Lecture de {url}"),
+            on_error=lambda url: self.set_status(f"Lecture impossible: {url}"),
+        )
+        pool.preload(next_urls)
 
     def add_to_favorites(self):
-        selected = self.listbox.curselection()
-        if selected:
-            index = selected[0]
-            entry = self.listbox.get(index)
-            parts = entry.split(" - ")
-            url = parts[0].split(": ")[1]
+        record = self.subscription_list.selected()
+        if record:
+            url = record['url']
             # Implement logic to add to favorites
             pass
 
-    def store_subscription(self, url, mac):
-        # Store the subscription credentials in a JSON file or any secure storage
-        with open('subscription.json', 'w') as f:
-            json.dump({'url': url, 'mac': mac}, f)
+    def store_subscription(self, url, mac, mode=None):
+        # Queued to the subscription store's writer thread, never blocks the UI
+        self.subscription_manager.store.add(url, mac, mode)
 
     def load_stored_subscription(self):
-        # Load the stored subscription credentials if available
+        store = self.subscription_manager.store
+        # Import the single entry kept by older versions in subscription.json
         if os.path.exists('subscription.json'):
             with open('subscription.json', 'r') as f:
                 data = json.load(f)
-                self.stored_subscription = (data['url'], data['mac'])
-        else:
-            self.stored_subscription = None
+            store.add(data['url'], data.get('mac'))
+            store.flush()
+            os.replace('subscription.json', 'subscription.json.bak')
+        self.stored_subscription = store.last_subscription()
 
     def auto_connect(self):
         # Automatically connect using stored credentials if available
         if self.stored_subscription:
             url, mac = self.stored_subscription
-            connection = ServerConnection(url, mac)
-            asyncio.run(connection.connect())
+            connection = self.subscription_manager.get_connection(url, mac)
+            self.bridge.run(
+                lambda progress: connection.connect(),
+                on_done=lambda ok: self.set_status(f"Connecté à {url}" if ok else f"Échec de connexion à {url}"),
+                on_error=lambda error: logging.warning(f"Connexion automatique impossible à {url}: {error}"),
+            )
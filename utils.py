@@ -1,3 +1,16 @@
+import re
+import unicodedata
+
 __version__ = "1.0.0"
 
-# Placeholder for shared utilities or constants
+# Shared utilities and constants
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_text(text):
+    """Case- and accent-fold text and collapse punctuation, e.g. 'Amélie (2001)' -> 'amelie 2001'."""
+    text = unicodedata.normalize('NFKD', text)
+    if not text.isascii():
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD.sub(' ', text.casefold()).strip()
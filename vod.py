@@ -1,12 +1,400 @@
+import codecs
+import heapq
+import json
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict, namedtuple
+from http_client import get_client
+import metrics
+from m3u_parser import M3uParser
+from startup import lazy_import
+from utils import normalize_text
+
+requests = lazy_import('requests')
+
 __version__ = "2.0.0"
 
-class VodManager:
+CHUNK_SIZE = 64 * 1024
+LOAD_BATCH_SIZE = 2000
+# Ids gathered per limited search before ranking; a limit=None search is not capped
+MAX_CANDIDATES = 1000
+
+VodItem = namedtuple('VodItem', ['id', 'title', 'category', 'url'])
+
+VOD_SEARCH_SECONDS = metrics.histogram(
+    'checkerip_vod_search_seconds', "VOD title search latency",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class VodIndex:
+    """Inverted index over VOD titles supporting prefix and substring queries.
+
+    Titles are normalised once and split into tokens. Tokens are kept in a
+    sorted list for prefix lookups, and token trigrams are indexed for
+    substring lookups. Titles can be added and removed without rebuilding.
+    A query only examines a bounded number of ids: postings are walked
+    shortest token first and, within a token, shortest title first (the
+    order is computed on first use and dropped when the token changes).
+    """
 
     def __init__(self):
-        self.vod_list = []
+        self.titles = {}
+        self.keys = {}
+        self.token_ids = {}
+        self.sorted_tokens = []
+        self.trigram_tokens = {}
+        self._ordered = {}
+
+    def add(self, item_id, title, _bulk=False):
+        if item_id in self.titles:
+            self.remove(item_id)
+        key = normalize_text(title)
+        self.titles[item_id] = title
+        self.keys[item_id] = key
+        new_tokens = []
+        for token in key.split():
+            ids = self.token_ids.get(token)
+            if ids is None:
+                ids = self.token_ids[token] = set()
+                if _bulk:
+                    new_tokens.append(token)
+                else:
+                    insort(self.sorted_tokens, token)
+                for trigram in _trigrams(token):
+                    self.trigram_tokens.setdefault(trigram, set()).add(token)
+            ids.add(item_id)
+            self._ordered.pop(token, None)
+        return new_tokens
+
+    def add_many(self, items):
+        """Bulk-add (item_id, title) pairs, merging their new tokens into the sorted token list once."""
+        new_tokens = set()
+        for item_id, title in items:
+            new_tokens.update(self.add(item_id, title, _bulk=True))
+        # Two sorted runs, so the sort is a linear merge
+        self.sorted_tokens.extend(sorted(token for token in new_tokens if token in self.token_ids))
+        self.sorted_tokens.sort()
+
+    def remove(self, item_id):
+        key = self.keys.pop(item_id, None)
+        if key is None:
+            return
+        del self.titles[item_id]
+        for token in set(key.split()):
+            ids = self.token_ids[token]
+            ids.discard(item_id)
+            self._ordered.pop(token, None)
+            if ids:
+                continue
+            del self.token_ids[token]
+            index = bisect_left(self.sorted_tokens, token)
+            # Tokens new to a running add_many are not in the sorted list yet
+            if index < len(self.sorted_tokens) and self.sorted_tokens[index] == token:
+                del self.sorted_tokens[index]
+            for trigram in _trigrams(token):
+                tokens = self.trigram_tokens[trigram]
+                tokens.discard(token)
+                if not tokens:
+                    del self.trigram_tokens[trigram]
+
+    def _posting(self, token):
+        ordered = self._ordered.get(token)
+        if ordered is None:
+            keys = self.keys
+            ordered = self._ordered[token] = sorted(self.token_ids[token], key=lambda item_id: len(keys[item_id]))
+        return ordered
+
+    def order_postings(self):
+        """Precompute the order of every posting too large to be taken whole, so first queries stay fast."""
+        for token, ids in self.token_ids.items():
+            if len(ids) > MAX_CANDIDATES:
+                self._posting(token)
+
+    def _prefix_tokens(self, prefix):
+        low = bisect_left(self.sorted_tokens, prefix)
+        high = bisect_left(self.sorted_tokens, prefix + '\U0010ffff', low)
+        # Shortest tokens first so the closest matches come out before the candidate cap.
+        return sorted(self.sorted_tokens[low:high], key=len)
+
+    def _substring_tokens(self, fragment):
+        postings = sorted((self.trigram_tokens.get(trigram, set()) for trigram in _trigrams(fragment)), key=len)
+        if not postings or not postings[0]:
+            return []
+        return sorted((token for token in postings[0].intersection(*postings[1:]) if fragment in token), key=len)
+
+    def _matching_ids(self, fragment):
+        tokens = self._substring_tokens(fragment) if len(fragment) >= 3 else self._prefix_tokens(fragment)
+        return set().union(*(self.token_ids[token] for token in tokens))
+
+    def _collect(self, tokens, allowed, found):
+        """Add the ids of tokens (restricted to allowed unless None) to found, up to MAX_CANDIDATES."""
+        for token in tokens:
+            if len(found) >= MAX_CANDIDATES:
+                break
+            room = MAX_CANDIDATES - len(found)
+            if allowed is None:
+                found.update(self._posting(token)[:room])
+                continue
+            hits = self.token_ids[token] & allowed
+            if len(hits) > room:
+                hits = [item_id for item_id in self._posting(token) if item_id in hits][:room]
+            found.update(hits)
+        return found
+
+    def search(self, query, limit=50):
+        """Return up to `limit` item ids matching every query token, best matches first.
+
+        Ranking: exact title, title prefix, word-prefix phrase, then substring
+        matches; shorter titles win ties. A limited search only ranks up to
+        MAX_CANDIDATES ids, so a very common first word may miss some matches.
+        With limit=None every title containing all the tokens is returned
+        (every title for an empty query), at the cost of a full scan.
+        """
+        normalized = normalize_text(query)
+        if limit is None:
+            tokens = normalized.split()
+            if not tokens:
+                return list(self.keys)
+            candidates = [item_id for item_id, key in self.keys.items() if all(token in key for token in tokens)]
+            return sorted(candidates, key=self._rank(normalized))
+        if not normalized:
+            return []
+        first, *others = sorted(set(normalized.split()), key=len, reverse=True)
+        # Other tokens are resolved to id sets once; one or two letters are checked on the final candidates.
+        short = [token for token in others if len(token) < 3]
+        allowed = None
+        for token in others:
+            if len(token) >= 3:
+                ids = self._matching_ids(token)
+                allowed = ids if allowed is None else allowed & ids
+        if allowed is not None and len(allowed) <= MAX_CANDIDATES:
+            if len(first) >= 3:
+                candidates = {item_id for item_id in allowed if first in self.keys[item_id]}
+            else:
+                candidates = {item_id for item_id in allowed if f" {first}" in f" {self.keys[item_id]}"}
+        else:
+            candidates = self._collect(self._prefix_tokens(first), allowed, set())
+            # Substring-only matches always rank last, so skip them when prefixes already fill the page.
+            if len(first) >= 3 and (others or len(candidates) < limit):
+                self._collect(self._substring_tokens(first), allowed, candidates)
+        if short:
+            candidates = [item_id for item_id in candidates if all(token in self.keys[item_id] for token in short)]
+
+        return heapq.nsmallest(limit, candidates, key=self._rank(normalized))
+
+    def _rank(self, normalized):
+        phrase = f" {normalized}"
+        keys = self.keys
+
+        def rank(item_id):
+            key = keys[item_id]
+            if key == normalized:
+                tier = 0
+            elif key.startswith(normalized):
+                tier = 1
+            elif phrase in key:
+                tier = 2
+            else:
+                tier = 3
+            return tier, len(key), key
+
+        return rank
+
+
+def iter_json_array(chunks):
+    """Yield the elements of a top-level JSON array of objects from a stream of byte chunks."""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,[':
+                position += 1
+            if position >= len(buffer) or buffer[position] == ']':
+                break
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # element continues in the next chunk
+            yield element
+        buffer = buffer[position:]
+    if buffer.strip(' \t\r\n]'):
+        raise ValueError("Réponse JSON tronquée ou invalide")
+
+
+class XtreamVodSource:
+    """VOD catalog of an Xtream Codes account, streamed from player_api.php."""
+
+    def __init__(self, server_url, username, password):
+        self.server_url = server_url.rstrip('/')
+        self.username = username
+        self.password = password
+
+    def _api(self, action, stream=False, **params):
+        params.update(username=self.username, password=self.password, action=action)
+        client = get_client()
+        response = client.sync_session().get(f"{self.server_url}/player_api.php", params=params, stream=stream, timeout=client.sync_timeout)
+        response.raise_for_status()
+        return response
+
+    def iter_items(self):
+        categories = {str(c.get('category_id')): c.get('category_name') for c in self._api('get_vod_categories').json()}
+        with self._api('get_vod_streams', stream=True) as response:
+            for stream in iter_json_array(response.iter_content(CHUNK_SIZE)):
+                stream_id = stream.get('stream_id')
+                extension = stream.get('container_extension') or 'mp4'
+                yield VodItem(
+                    stream_id,
+                    stream.get('name') or '',
+                    categories.get(str(stream.get('category_id'))),
+                    f"{self.server_url}/movie/{self.username}/{self.password}/{stream_id}.{extension}",
+                )
+
+    def fetch_metadata(self, item):
+        info = self._api('get_vod_info', vod_id=item.id).json().get('info') or {}
+        return {key: info.get(key) for key in ('plot', 'cast', 'director', 'genre', 'releasedate', 'rating', 'movie_image', 'backdrop_path')}
+
+
+class M3uVodSource:
+    """VOD entries listed in an M3U playlist file or URL."""
+
+    def __init__(self, location):
+        self.location = location
+
+    def iter_items(self):
+        for count, entry in enumerate(M3uParser(self.location)):
+            yield VodItem(count, entry.name, entry.group, entry.url)
+
+
+class CachedVodSource:
+    """VOD catalog previously written by VodManager.save_cache (one JSON array per line)."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def iter_items(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield VodItem(*json.loads(line))
+
+
+class VodManager:
+
+    def __init__(self, metadata_cache_size=256):
+        self.items = {}
+        self.index = VodIndex()
+        self.lock = threading.Lock()
+        self.loading = threading.Event()
+        self.metadata_fetcher = None
+        self.metadata_cache_size = metadata_cache_size
+        self._metadata = OrderedDict()
+
+    @property
+    def vod_list(self):
+        return [item.title for item in self.items.values()]
 
     def load_vod(self, vod_data):
-        self.vod_list = vod_data.splitlines()
+        """Load a catalog given as one title per line."""
+        self.load_items(VodItem(i, title, None, None) for i, title in enumerate(vod_data.splitlines()))
+
+    def load_source(self, source, background=True):
+        """Load items from an Xtream, M3U or cache source.
+
+        In background mode the catalog is loaded by a worker thread in batches,
+        and search_vod can be used while it is still loading.
+        """
+        self.metadata_fetcher = getattr(source, 'fetch_metadata', None)
+        if not background:
+            return self.load_items(source.iter_items())
+        thread = threading.Thread(target=self.load_items, args=(source.iter_items(),), daemon=True)
+        thread.start()
+        return thread
+
+    def load_items(self, items):
+        with self.lock:
+            self.items = {}
+            self.index = VodIndex()
+            self._metadata.clear()
+        self.loading.set()
+        count = 0
+        batch = []
+        try:
+            for item in items:
+                batch.append(item)
+                if len(batch) >= LOAD_BATCH_SIZE:
+                    count += self._add_batch(batch)
+                    batch = []
+            count += self._add_batch(batch)
+            with self.lock:
+                self.index.order_postings()
+            logging.info(f"{count} VOD chargés")
+        except (requests.exceptions.RequestException, OSError, ValueError) as e:
+            logging.error(f"Erreur lors du chargement du catalogue VOD: {e}")
+        finally:
+            self.loading.clear()
+        return count
+
+    def _add_batch(self, batch):
+        # One sorted-token merge per batch; searches see the index between batches
+        with self.lock:
+            for item in batch:
+                self.items[item.id] = item
+            self.index.add_many((item.id, item.title) for item in batch)
+        return len(batch)
+
+    def save_cache(self, path):
+        with self.lock:
+            items = list(self.items.values())
+        with open(path, 'w', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    def add_vod(self, title):
+        with self.lock:
+            vod_id = max(self.items, default=-1) + 1
+            self.items[vod_id] = VodItem(vod_id, title, None, None)
+            self.index.add(vod_id, title)
+        return vod_id
+
+    def remove_vod(self, vod_id):
+        with self.lock:
+            self.items.pop(vod_id, None)
+            self._metadata.pop(vod_id, None)
+            self.index.remove(vod_id)
+
+    def search_items(self, query, limit=50):
+        """Best `limit` matches as VodItems (see VodIndex.search); limit=None returns every match."""
+        with metrics.span('vod.search', VOD_SEARCH_SECONDS, query=query), self.lock:
+            return [self.items[vod_id] for vod_id in self.index.search(query, limit)]
+
+    def search_vod(self, query, limit=50):
+        """Titles of the best `limit` matches; pass limit=None for every title containing the query words."""
+        return [item.title for item in self.search_items(query, limit)]
 
-    def search_vod(self, query):
-        return [vod for vod in self.vod_list if query.lower() in vod.lower()]
+    def get_metadata(self, vod_id):
+        """Return plot/cast/poster details for an item, fetched on first access and kept in a bounded LRU."""
+        with self.lock:
+            if vod_id in self._metadata:
+                self._metadata.move_to_end(vod_id)
+                return self._metadata[vod_id]
+            item = self.items.get(vod_id)
+        if item is None or self.metadata_fetcher is None:
+            return None
+        try:
+            metadata = self.metadata_fetcher(item)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error(f"Erreur lors de la récupération des détails VOD {vod_id}: {e}")
+            return None
+        with self.lock:
+            self._metadata[vod_id] = metadata
+            while len(self._metadata) > self.metadata_cache_size:
+                self._metadata.popitem(last=False)
+        return metadata